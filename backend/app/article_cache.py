@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from app.config import CATEGORY_CACHE_SIZE
+from app.database import read_session, Article
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryArticleCache:
+    """Latest articles per category, shared by every digest until ingestion commits more"""
+
+    def __init__(self, size):
+        self.size = size
+        self._articles = {}  # category name -> articles, newest first
+        self.loaded = False
+        self.refreshed_at = None  # time.monotonic() of the last refresh
+        self.refreshed_at_utc = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.latest_article_id = None  # newest article id when last refreshed
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        """Reload the top articles of every category with a single windowed query"""
+        async with self._lock:
+            ranked = (
+                select(
+                    Article.id,
+                    func.row_number().over(
+                        partition_by=Article.category_id,
+                        order_by=Article.published_at.desc(),
+                    ).label("rank"),
+                )
+                .subquery()
+            )
+            async with read_session() as session:
+                latest_article_id = await session.scalar(select(func.max(Article.id)))
+                result = await session.execute(
+                    select(Article)
+                    .join(ranked, ranked.c.id == Article.id)
+                    .where(ranked.c.rank <= self.size)
+                    .options(selectinload(Article.category))
+                    .order_by(Article.published_at.desc())
+                )
+                articles = result.scalars().all()
+
+            by_category = {}
+            for article in articles:
+                if article.category is not None:
+                    by_category.setdefault(article.category.name, []).append(article)
+            self._articles = by_category
+            self.latest_article_id = latest_article_id
+            self.loaded = True
+            self.refreshed_at = time.monotonic()
+            self.refreshed_at_utc = datetime.utcnow()
+            self.refreshes += 1
+            logger.info(f"Category article cache refreshed with {len(articles)} articles")
+
+    async def refresh_if_stale(self):
+        """Refresh if articles were saved since the last refresh, e.g. by another app instance"""
+        async with read_session() as session:
+            latest_article_id = await session.scalar(select(func.max(Article.id)))
+        if not self.loaded or latest_article_id != self.latest_article_id:
+            await self.refresh()
+
+    async def get(self, category_name, limit):
+        """Latest articles in a category, or None if the cache cannot answer"""
+        if not self.loaded:
+            await self.refresh()
+        if limit > self.size:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._articles.get(category_name, [])[:limit]
+
+    def metrics(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "refreshes": self.refreshes,
+            "refreshed_at": self.refreshed_at_utc,
+            "staleness_seconds": (
+                round(time.monotonic() - self.refreshed_at, 1) if self.refreshed_at is not None else None
+            ),
+        }
+
+
+category_cache = CategoryArticleCache(CATEGORY_CACHE_SIZE)
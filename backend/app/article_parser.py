@@ -0,0 +1,33 @@
+"""Article parsing stage that runs inside worker processes.
+
+Kept free of app imports (database, config, telegram) so that worker
+processes start quickly and only pay for newspaper/NLTK.
+"""
+from newspaper import Article
+
+
+def parse_html(url, html):
+    """Parse raw article HTML into a compact record"""
+    article = Article(url)
+    article.download(input_html=html)
+    article.parse()
+    article.nlp()  # This extracts keywords, summary, etc.
+    return {
+        "url": url,
+        "title": article.title,
+        "text": article.text,
+        "summary": article.summary,
+        "keywords": list(article.keywords),
+        "publish_date": article.publish_date,
+    }
+
+
+def parse_batch(items):
+    """Parse a batch of (url, html) pairs, reporting failures per article"""
+    records = []
+    for url, html in items:
+        try:
+            records.append(parse_html(url, html))
+        except Exception as e:
+            records.append({"url": url, "error": str(e)})
+    return records
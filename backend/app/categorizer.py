@@ -0,0 +1,127 @@
+"""Keyword-weighted linear categorizer for news articles.
+
+Each category has a weighted lexicon; the lexicons are compiled once into a
+token -> [(category index, weight)] table, so scoring an article is a single
+pass over its tokens regardless of how many categories exist.
+"""
+import math
+import re
+from collections import Counter
+
+from app.config import NEWS_CATEGORIES
+
+DEFAULT_CATEGORY = "general"
+
+# Minimum weighted score for a category to be assigned at all
+MIN_SCORE = 2.0
+
+# Matches in the title and extracted keywords say more than a passing mention in the body
+FIELD_WEIGHTS = {"title": 3.0, "keywords": 2.0, "summary": 1.5, "text": 1.0}
+
+CATEGORY_LEXICON = {
+    "politics": {
+        "election": 3, "elections": 3, "senate": 3, "congress": 3, "president": 2, "presidential": 3,
+        "democrats": 3, "republicans": 3, "democratic": 2, "republican": 2, "gop": 3, "campaign": 2,
+        "vote": 2, "voters": 3, "ballot": 3, "governor": 2, "legislation": 2, "lawmakers": 3,
+        "parliament": 3, "minister": 2, "politics": 2, "political": 2, "white": 0.5, "house": 0.5,
+        "impeachment": 3, "diplomat": 2, "sanctions": 2, "policy": 1, "administration": 1.5,
+    },
+    "business": {
+        "stocks": 3, "stock": 2, "market": 1.5, "markets": 2, "economy": 3, "economic": 2,
+        "inflation": 3, "earnings": 3, "revenue": 2, "profit": 2, "investors": 3, "shares": 2,
+        "company": 1, "companies": 1, "ceo": 2, "merger": 3, "acquisition": 2, "bank": 1.5,
+        "fed": 2, "interest": 1, "rates": 1.5, "trade": 1.5, "tariffs": 2, "retail": 2,
+        "business": 2, "dow": 3, "nasdaq": 3, "layoffs": 2, "startup": 1.5,
+    },
+    "technology": {
+        "technology": 3, "tech": 3, "software": 3, "ai": 3, "artificial": 1.5, "intelligence": 1,
+        "apple": 2, "google": 2, "microsoft": 2, "meta": 2, "amazon": 1, "smartphone": 3, "iphone": 3,
+        "app": 2, "apps": 2, "cyber": 3, "cybersecurity": 3, "hackers": 3, "data": 1, "chip": 3,
+        "chips": 3, "semiconductor": 3, "internet": 2, "online": 1, "robot": 2, "computing": 3,
+        "startup": 1, "algorithm": 2, "openai": 3,
+    },
+    "science": {
+        "science": 3, "scientists": 3, "scientific": 3, "research": 2, "researchers": 2, "study": 1.5,
+        "nasa": 3, "space": 2, "planet": 3, "astronomers": 3, "telescope": 3, "climate": 2,
+        "species": 3, "fossil": 3, "physics": 3, "experiment": 2, "discovery": 1.5, "galaxy": 3,
+        "mars": 3, "moon": 2, "rocket": 2, "ocean": 1, "evolution": 2, "quantum": 3,
+    },
+    "health": {
+        "health": 3, "medical": 3, "hospital": 2, "doctors": 2, "patients": 3, "disease": 3,
+        "virus": 3, "vaccine": 3, "vaccines": 3, "cancer": 3, "covid": 3, "pandemic": 3,
+        "drug": 2, "drugs": 2, "fda": 3, "treatment": 2, "symptoms": 3, "mental": 2,
+        "obesity": 3, "diet": 2, "outbreak": 3, "cdc": 3, "clinical": 3, "surgery": 3,
+    },
+    "entertainment": {
+        "movie": 3, "movies": 3, "film": 3, "films": 3, "actor": 3, "actress": 3, "hollywood": 3,
+        "music": 3, "album": 3, "singer": 3, "celebrity": 3, "tv": 2, "television": 2,
+        "netflix": 3, "series": 1, "oscar": 3, "oscars": 3, "grammy": 3, "concert": 3,
+        "box": 0.5, "office": 0.5, "star": 1, "show": 1, "entertainment": 3, "streaming": 2,
+    },
+    "sports": {
+        "sports": 3, "game": 1.5, "games": 1.5, "team": 2, "season": 2, "coach": 3, "players": 2,
+        "player": 2, "league": 3, "nfl": 3, "nba": 3, "mlb": 3, "nhl": 3, "soccer": 3,
+        "football": 3, "basketball": 3, "baseball": 3, "tennis": 3, "golf": 3, "olympics": 3,
+        "championship": 3, "tournament": 3, "score": 1.5, "win": 1, "victory": 1.5, "playoffs": 3,
+        "quarterback": 3, "goal": 1,
+    },
+}
+
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9]+")
+
+
+def compile_lexicon(lexicon):
+    """Turn {category: {term: weight}} into (categories, {term: [(index, weight)]})"""
+    categories = list(lexicon)
+    table = {}
+    for index, category in enumerate(categories):
+        for term, weight in lexicon[category].items():
+            table.setdefault(term, []).append((index, float(weight)))
+    return categories, table
+
+
+# Configured categories without a curated lexicon still match on their own name
+CATEGORIES, _TERM_WEIGHTS = compile_lexicon(
+    {category: CATEGORY_LEXICON.get(category, {category: 3}) for category in NEWS_CATEGORIES}
+)
+
+
+def _tokens(value):
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        value = " ".join(value)
+    return _TOKEN_RE.findall(value.lower())
+
+
+def score_article(article):
+    """Weighted score per category for an article record (title, keywords, summary, text)"""
+    scores = [0.0] * len(CATEGORIES)
+    for field_name, field_weight in FIELD_WEIGHTS.items():
+        counts = Counter(_tokens(article.get(field_name)))
+        for term, count in counts.items():
+            entries = _TERM_WEIGHTS.get(term)
+            if entries:
+                # Repeated mentions help, but with diminishing returns
+                boost = field_weight * (1.0 + math.log(count))
+                for index, weight in entries:
+                    scores[index] += weight * boost
+    return scores
+
+
+def rank_categories(scores):
+    """Categories with a positive score, best first, with confidence as share of the total"""
+    total = sum(scores)
+    if total <= 0 or max(scores) < MIN_SCORE:
+        return [(DEFAULT_CATEGORY, 1.0)]
+    ranked = sorted(
+        ((CATEGORIES[index], score / total) for index, score in enumerate(scores) if score > 0),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return [(category, round(confidence, 3)) for category, confidence in ranked]
+
+
+def categorize_batch(articles):
+    """Rank categories for many article records in one call"""
+    return [rank_categories(score_article(article)) for article in articles]
@@ -3,6 +3,8 @@ from sqlalchemy.future import select
 from app.config import NEWS_CATEGORIES
 from app.database import User
 from app.recommendation import generate_digest_for_user
+from app.digest_buckets import is_valid_timezone, utc_minute_of_day
+from app.user_context import user_contexts
 import json
 import logging
 
@@ -21,6 +23,8 @@ async def handle_command(message, session):
         return await handle_digest_command(user_id, session)
     elif command == "/time":
         return await handle_time_command(user_id)
+    elif command == "/timezone":
+        return await handle_timezone_command(message, session)
     else:
         # Not a recognized command, process as regular message
         return None
@@ -32,6 +36,7 @@ async def handle_help_command(user_id):
         "/categories - Set your news preferences\n"
         "/digest - Get your news digest now\n"
         "/time - Set your daily digest time\n"
+        "/timezone - Set your timezone, e.g. /timezone Europe/Berlin\n"
         "/help - Show this help message\n\n"
         "You can also just chat with me about news topics you're interested in!"
     )
@@ -120,6 +125,46 @@ async def handle_time_command(user_id):
         "reply_markup": reply_markup
     }
     
+async def handle_timezone_command(message, session):
+    """Handle /timezone command"""
+    user_id = message.from_user.id
+    parts = message.text.split()
+    
+    result = await session.execute(
+        select(User).where(User.telegram_id == user_id)
+    )
+    user = result.scalars().first()
+    
+    if not user:
+        return {
+            "chat_id": user_id,
+            "text": "Sorry, I couldn't find your user profile. Please try again later."
+        }
+    
+    if len(parts) < 2:
+        return {
+            "chat_id": user_id,
+            "text": f"Your timezone is {user.timezone}. To change it, send e.g. /timezone Europe/Berlin"
+        }
+    
+    timezone_name = parts[1]
+    if not is_valid_timezone(timezone_name):
+        return {
+            "chat_id": user_id,
+            "text": f"I don't know the timezone {timezone_name}. Please use a name like Europe/Berlin or America/New_York."
+        }
+    
+    # Digests go out at the same local time in the new timezone
+    user.timezone = timezone_name
+    user.digest_minute_utc = utc_minute_of_day(user.digest_time, timezone_name)
+    await session.commit()
+    user_contexts.invalidate(telegram_id=user_id)
+    
+    return {
+        "chat_id": user_id,
+        "text": f"Timezone set to {timezone_name}. Your digest will arrive at {user.digest_time} local time."
+    }
+    
 def convert_markdown_to_markdown_v2(markdown_text):
     """Convert regular Markdown to MarkdownV2, escaping necessary characters."""
     
@@ -7,20 +7,120 @@ load_dotenv()
 # Telegram settings
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+UPDATE_MODE = os.getenv("UPDATE_MODE", "webhook")  # "webhook", or "polling" (no public endpoint needed)
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org/bot")  # point at a fake API for load tests
+TELEGRAM_CONNECTION_POOL_SIZE = int(os.getenv("TELEGRAM_CONNECTION_POOL_SIZE", 32))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))  # messages per second, all chats
+TELEGRAM_PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", 1))  # messages per second, one chat
+TELEGRAM_SEND_RETRIES = int(os.getenv("TELEGRAM_SEND_RETRIES", 5))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # optional, checked against X-Telegram-Bot-Api-Secret-Token
+
+# Incoming update processing
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))  # webhook answers 503 when full
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 16))
+UPDATE_SHARDS = int(os.getenv("UPDATE_SHARDS", 4))  # users are spread over shards by telegram_id
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", 10000))  # recent update_ids remembered
+POLLING_BATCH_SIZE = int(os.getenv("POLLING_BATCH_SIZE", 100))  # updates per getUpdates call, at most 100
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", 30))  # long-poll wait in seconds
+POLLING_OFFSET_PATH = os.getenv("POLLING_OFFSET_PATH", "polling_offset.txt")  # next update_id, kept across restarts
 
 # Database settings
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///news_digest.db")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")  # optional Postgres replica for read-only queries
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 10))  # Postgres connections kept open
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 20))  # extra Postgres connections under load
+DATABASE_POOL_TIMEOUT = int(os.getenv("DATABASE_POOL_TIMEOUT", 30))  # seconds to wait for a free connection
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", 1800))  # seconds before a connection is replaced
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", 8))  # WAL readers, beyond which DATABASE_MAX_OVERFLOW applies
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # bytes
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", 0.2))  # queries slower than this are logged
+SLOW_QUERY_LOG_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_LOG_SAMPLE_RATE", 1.0))  # share of slow queries logged
 
 # LLM settings
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))  # in-memory LRU size
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # optional SQLite file for a persistent response cache
+# Seconds a cached LLM response stays valid, per call site (0 disables caching)
+LLM_CACHE_TTLS = {
+    "digest": int(os.getenv("LLM_CACHE_TTL_DIGEST", 1800)),
+    "digest_intro": int(os.getenv("LLM_CACHE_TTL_DIGEST_INTRO", 1800)),
+    "conversation": int(os.getenv("LLM_CACHE_TTL_CONVERSATION", 300)),
+    "preferences": int(os.getenv("LLM_CACHE_TTL_PREFERENCES", 86400)),
+    "memory_summary": int(os.getenv("LLM_CACHE_TTL_MEMORY_SUMMARY", 3600)),
+}
+
+# Conversation memory: recent turns verbatim plus a rolling summary of older ones
+CONVERSATION_HISTORY_TOKEN_BUDGET = int(os.getenv("CONVERSATION_HISTORY_TOKEN_BUDGET", 1000))  # history in chat replies
+DIGEST_INTRO_TOKEN_BUDGET = int(os.getenv("DIGEST_INTRO_TOKEN_BUDGET", 300))  # history in the digest intro prompt
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", 4))  # newest turns never folded into the summary
+MEMORY_SUMMARY_TRIGGER_TOKENS = int(os.getenv("MEMORY_SUMMARY_TRIGGER_TOKENS", 600))  # older turns' tokens before folding
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", 200))
+MEMORY_SUMMARY_BATCH_TOKENS = int(os.getenv("MEMORY_SUMMARY_BATCH_TOKENS", 4000))  # older turns folded per summary call
 
 # News settings
+# Each source is a URL or a dict with "url" and optional per-source overrides:
+# name, feeds (RSS/Atom/sitemap URLs), refresh_interval, max_concurrency, requests_per_second,
+# max_articles, timeout
 NEWS_SOURCES= ["https://www.cnn.com"]
+NEWS_SOURCES_FILE = os.getenv("NEWS_SOURCES_FILE")  # optional JSON list replacing NEWS_SOURCES
 NEWS_UPDATE_INTERVAL = int(os.getenv("NEWS_UPDATE_INTERVAL", 60))  # minutes
+NEWS_MAX_ARTICLES_PER_SOURCE = 300
+
 NEWS_CATEGORIES = ["politics", "business", "technology", "science", "health", "entertainment", "sports"]
 # NEWS_CATEGORIES = ["politics", "business", "technology", "science", "health", "entertainment", "sports"]
 
+# Ingestion settings
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 20))  # concurrent article downloads, all sources
+INGEST_PER_HOST_LIMIT = int(os.getenv("INGEST_PER_HOST_LIMIT", 5))  # default concurrent downloads per source
+INGEST_SOURCE_REQUESTS_PER_SECOND = float(os.getenv("INGEST_SOURCE_REQUESTS_PER_SECOND", 5))  # default per source
+INGEST_SOURCE_TIMEOUT = float(os.getenv("INGEST_SOURCE_TIMEOUT", 600))  # seconds for one source refresh
+INGEST_MAX_PARALLEL_SOURCES = int(os.getenv("INGEST_MAX_PARALLEL_SOURCES", 8))
+INGEST_NLP_WORKERS = int(os.getenv("INGEST_NLP_WORKERS", os.cpu_count() or 1))  # processes for parse/nlp
+INGEST_NLP_BATCH_SIZE = int(os.getenv("INGEST_NLP_BATCH_SIZE", 8))  # pages sent to a worker at once
+INGEST_HTTP_TIMEOUT = float(os.getenv("INGEST_HTTP_TIMEOUT", 15))  # seconds
+INGEST_USER_AGENT = os.getenv("INGEST_USER_AGENT", "Mozilla/5.0 (compatible; NewsDigestBot/0.1)")
+SEEN_URL_INDEX_PATH = os.getenv("SEEN_URL_INDEX_PATH", "seen_urls.idx")  # known article URL fingerprints
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "http_cache")  # ETag/Last-Modified validators and bodies
+INGEST_MAX_SITEMAPS = int(os.getenv("INGEST_MAX_SITEMAPS", 3))  # child sitemaps read from a sitemap index
+
+# Near-duplicate detection settings
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", 3))  # max differing SimHash bits for the same story
+DEDUP_WINDOW_DAYS = int(os.getenv("DEDUP_WINDOW_DAYS", 7))  # how far back stories are matched
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", 5))  # shorter title+summary texts are not fingerprinted
+
+# Cached per-user context for conversational replies
+USER_CONTEXT_CACHE_SIZE = int(os.getenv("USER_CONTEXT_CACHE_SIZE", 10000))  # users kept in memory
+USER_CONTEXT_TTL = int(os.getenv("USER_CONTEXT_TTL", 300))  # seconds before a snapshot is reloaded
+USER_CONTEXT_HISTORY_TURNS = int(os.getenv("USER_CONTEXT_HISTORY_TURNS", 12))  # unsummarized turns kept; the token budget trims
+
+# Interaction event log
+INTERACTION_FLUSH_SIZE = int(os.getenv("INTERACTION_FLUSH_SIZE", 500))  # buffered events that trigger a flush
+INTERACTION_FLUSH_SECONDS = float(os.getenv("INTERACTION_FLUSH_SECONDS", 2))  # longest an event stays buffered
+INTERACTION_BUFFER_MAX = int(os.getenv("INTERACTION_BUFFER_MAX", 100000))  # oldest events dropped beyond this
+INTERACTION_RETENTION_MONTHS = int(os.getenv("INTERACTION_RETENTION_MONTHS", 6))  # monthly event tables kept
+INTERACTION_MAX_ATTEMPTS = int(os.getenv("INTERACTION_MAX_ATTEMPTS", 3))  # flushes an event may fail before it is dropped
+
+# Scheduler settings
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", 4))  # jobs running at once
+
+# Job queue settings (work shared between app instances)
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))  # a crashed worker's jobs are retaken after this
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_CLAIM_BATCH = int(os.getenv("JOB_CLAIM_BATCH", 100))  # jobs claimed per round trip
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", 48))  # finished jobs kept this long
+
 # Digest settings
+CATEGORY_CACHE_SIZE = int(os.getenv("CATEGORY_CACHE_SIZE", 20))  # latest articles cached per category
 DEFAULT_DIGEST_TIME = "08:00"  # Default time for daily digest (24-hour format)
-ARTICLES_PER_DIGEST = int(os.getenv("ARTICLES_PER_DIGEST", 5))
\ No newline at end of file
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")  # IANA timezone for users who haven't set one
+DIGEST_CATCHUP_MINUTES = int(os.getenv("DIGEST_CATCHUP_MINUTES", 180))  # how far back missed delivery buckets are sent
+ARTICLES_PER_DIGEST = int(os.getenv("ARTICLES_PER_DIGEST", 5))
+DIGEST_GENERATION_CONCURRENCY = int(os.getenv("DIGEST_GENERATION_CONCURRENCY", 20))  # concurrent LLM digest calls
+DIGEST_PREGENERATE_LEAD = int(os.getenv("DIGEST_PREGENERATE_LEAD", 30))  # minutes before delivery to start generating
+DIGEST_PATCH_NEW_ARTICLES = os.getenv("DIGEST_PATCH_NEW_ARTICLES", "true").lower() == "true"  # append stories published after generation
+DIGEST_PATCH_MAX_ARTICLES = int(os.getenv("DIGEST_PATCH_MAX_ARTICLES", 2))
+DIGEST_COHORT_TTL = int(os.getenv("DIGEST_COHORT_TTL", 3600))  # seconds a cohort's shared digest body is reused
+DIGEST_COHORT_CACHE_SIZE = int(os.getenv("DIGEST_COHORT_CACHE_SIZE", 2000))  # cohort bodies kept (LRU)
+DIGEST_PERSONAL_INTRO_LLM = os.getenv("DIGEST_PERSONAL_INTRO_LLM", "true").lower() == "true"  # short LLM intro for users with conversations
\ No newline at end of file
@@ -2,9 +2,11 @@ import logging
 from datetime import datetime
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
-from app.config import GEMINI_API_KEY, LLM_MODEL
-from app.database import Conversation, User, Article, user_interactions
-from litellm import acompletion
+from app.config import GEMINI_API_KEY, LLM_MODEL, CONVERSATION_HISTORY_TOKEN_BUDGET, USER_CONTEXT_HISTORY_TURNS
+from app.database import Conversation, User, Article, InteractionSummary
+from app.llm_client import cached_completion
+from app.user_context import user_contexts
+from app.conversation_memory import Turn, count_tokens, load_memory, history_messages, schedule_summary_update
 import json
 
 logger = logging.getLogger(__name__)
@@ -27,21 +29,10 @@ Recent articles discussed with this user: {recent_articles}
 Respond in markdown format.
 """
 
-async def get_conversation_history(session, user_id, limit=5):
-    """Fetch recent conversation history for context"""
-    result = await session.execute(
-        select(Conversation)
-        .where(Conversation.user_id == user_id)
-        .order_by(Conversation.timestamp.desc())
-        .limit(limit)
-    )
-    conversations = result.scalars().all()
-    # Convert to list of messages for context
-    history = []
-    for conv in reversed(conversations):
-        history.append({"role": "user", "content": conv.message})
-        history.append({"role": "assistant", "content": conv.response})
-    return history
+async def get_conversation_history(session, user_id, limit=USER_CONTEXT_HISTORY_TURNS):
+    """Fetch the conversation summary and recent turns for context, within the token budget"""
+    memory = await load_memory(session, user_id, limit)
+    return history_messages(memory, CONVERSATION_HISTORY_TOKEN_BUDGET)
 
 async def get_user_preferences(user, session):
     """Get user preferences as a formatted string"""
@@ -63,12 +54,12 @@ async def get_user_preferences(user, session):
 async def get_recent_articles(session, user_id, limit=3):
     """Get recently discussed articles based on user interactions."""
     try:
-        # Query user interactions, join with articles, and filter by user_id
+        # Read the per-article interaction rollup, most recent interaction first
         result = await session.execute(
             select(Article)
-            .join(user_interactions)
-            .where(user_interactions.c.user_id == user_id)
-            .order_by(user_interactions.c.timestamp.desc())  # Order by most recent interaction
+            .join(InteractionSummary, InteractionSummary.article_id == Article.id)
+            .where(InteractionSummary.user_id == user_id)
+            .order_by(InteractionSummary.last_at.desc())
             .limit(limit)
         )
         
@@ -85,20 +76,29 @@ async def get_recent_articles(session, user_id, limit=3):
         logger.error(f"Error fetching recent articles for user {user_id}: {e}")
         return "Error fetching recent articles."
 
-async def process_message_with_llm(message, user, session):
-    """Process a user message with the LLM and generate a response"""
+async def process_message_with_llm(message, user, session, context=None):
+    """Process a user message with the LLM and generate a response.
+
+    `context` is the user's UserContext; without it, preferences, recent
+    articles and history are queried here.
+    """
     # logger.info(f"------->Processing message with LLM: {message}")
-    # Get user preferences
-    preferences = await get_user_preferences(user, session)
+    if context is not None:
+        preferences = ", ".join(context.preferences) or "No specific preferences set yet."
+        recent_articles = "\n".join(context.recent_articles) or "No recent articles discussed."
+        history = history_messages(context.memory, CONVERSATION_HISTORY_TOKEN_BUDGET)
+    else:
+        # Get user preferences
+        preferences = await get_user_preferences(user, session)
+        
+        # Get recent articles
+        recent_articles = await get_recent_articles(session, user.id)
+        
+        # Get conversation history
+        history = await get_conversation_history(session, user.id)
     
     logger.info(f"++++++++User preferences: {preferences}")
     
-    # Get recent articles
-    recent_articles = await get_recent_articles(session, user.id)
-    
-    # Get conversation history
-    history = await get_conversation_history(session, user.id)
-    
     # Create system prompt with user context
     system_message = SYSTEM_PROMPT.format(
         preferences=preferences,
@@ -121,7 +121,8 @@ async def process_message_with_llm(message, user, session):
     
     try:
         # Call the LLM API
-        response = await acompletion(
+        response, _ = await cached_completion(
+            "conversation",
             model=LLM_MODEL,
             messages=messages,
             max_tokens=500,
@@ -141,10 +142,16 @@ async def save_conversation(session, user_id, message, response):
         user_id=user_id,
         message=message,
         response=response,
+        tokens=count_tokens(message) + count_tokens(response),
         timestamp=datetime.utcnow()
     )
     session.add(conversation)
     await session.commit()
+    user_contexts.record_turn(
+        user_id, Turn(conversation.id, message, response, conversation.tokens)
+    )
+    # Fold older turns into the rolling summary without delaying the reply
+    schedule_summary_update(user_id, on_update=user_contexts.apply_summary)
     return conversation
 
 async def analyze_message_for_preferences(message, session):
@@ -154,7 +161,8 @@ async def analyze_message_for_preferences(message, session):
     
     # Example implementation:
     try:
-        response = await acompletion(
+        response, _ = await cached_completion(
+            "preferences",
             model=LLM_MODEL,
             messages=[
                 {"role": "system", "content": "Extract news categories that the user might be interested in based on their message. Respond with a JSON array of category names from this list: politics, business, technology, science, health, entertainment, sports. If no categories are mentioned or implied, return an empty array."},
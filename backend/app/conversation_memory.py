@@ -0,0 +1,250 @@
+"""Token-budgeted conversation memory.
+
+A user's memory is a rolling summary of their older conversation turns
+plus the turns not yet folded into it. Each turn stores its token count
+when it is saved. Prompts take the newest turns that fit a token budget,
+then the summary if there is room, instead of a fixed number of raw turns.
+
+After a turn is saved, older turns beyond the newest MEMORY_RECENT_TURNS
+are folded into the summary in the background once they add up to
+MEMORY_SUMMARY_TRIGGER_TOKENS. That is one short LLM call that extends
+the previous summary, so a summary is never rebuilt from the full history.
+Each call folds at most MEMORY_SUMMARY_BATCH_TOKENS of the oldest turns,
+so a long backlog (e.g. right after the migration) catches up over several
+calls instead of overflowing the model's context.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+from litellm import token_counter
+from sqlalchemy.future import select
+
+from app.config import (
+    LLM_MODEL,
+    MEMORY_RECENT_TURNS,
+    MEMORY_SUMMARY_TRIGGER_TOKENS,
+    MEMORY_SUMMARY_MAX_TOKENS,
+    MEMORY_SUMMARY_BATCH_TOKENS,
+)
+from app.database import async_session, read_session, Conversation, ConversationSummary, dialect_insert
+from app.llm_client import cached_completion
+
+logger = logging.getLogger(__name__)
+
+# Tokens sent versus what the raw history would have cost, across prompts
+memory_metrics = {
+    "prompts": 0,
+    "history_tokens": 0,
+    "raw_history_tokens": 0,
+    "summaries": 0,
+    "summary_errors": 0,
+}
+_summarizing = {}  # user_id -> running summary task
+
+
+def count_tokens(text):
+    """Tokens of a text for the configured model"""
+    if not text:
+        return 0
+    try:
+        return token_counter(model=LLM_MODEL, text=text)
+    except Exception:
+        return len(text) // 4 + 1  # rough estimate for models the tokenizer does not know
+
+
+@dataclass
+class Turn:
+    id: int
+    message: str
+    response: str
+    tokens: int
+
+
+@dataclass
+class Memory:
+    """A user's summary and the turns after it, oldest first"""
+    summary: str = ""
+    summary_tokens: int = 0
+    covered_through: int = 0
+    covered_tokens: int = 0
+    turns: List[Turn] = field(default_factory=list)
+
+    def add_turn(self, turn, max_turns):
+        self.turns.append(turn)
+        del self.turns[:-max_turns]
+
+    def apply_summary(self, row):
+        """Take a newer summary, dropping the turns it now covers"""
+        self.summary = row.summary
+        self.summary_tokens = row.tokens
+        self.covered_through = row.covered_through
+        self.covered_tokens = row.covered_tokens
+        self.turns = [turn for turn in self.turns if turn.id > row.covered_through]
+
+
+def _turn(conversation):
+    tokens = conversation.tokens
+    if tokens is None:
+        tokens = count_tokens(conversation.message) + count_tokens(conversation.response)
+    return Turn(conversation.id, conversation.message, conversation.response, tokens)
+
+
+def newest_turns_query(user_id, covered_through, limit):
+    """Newest turns after `covered_through`, served by ix_conversations_user_timestamp"""
+    return (
+        select(Conversation)
+        .where(Conversation.user_id == user_id, Conversation.id > covered_through)
+        .order_by(Conversation.timestamp.desc())
+        .limit(limit)
+    )
+
+
+async def load_memory(session, user_id, max_turns):
+    """Summary plus up to `max_turns` of the newest turns it does not cover"""
+    summary = await session.get(ConversationSummary, user_id)
+    covered_through = summary.covered_through if summary else 0
+    result = await session.execute(newest_turns_query(user_id, covered_through, max_turns))
+    memory = Memory(turns=[_turn(conversation) for conversation in reversed(result.scalars().all())])
+    if summary is not None:
+        memory.apply_summary(summary)
+    return memory
+
+
+def _fit_turns(memory, budget):
+    """Newest turns that fit the budget (oldest first), and the budget left"""
+    kept = []
+    for turn in reversed(memory.turns):
+        if turn.tokens > budget:
+            break
+        kept.append(turn)
+        budget -= turn.tokens
+    kept.reverse()
+    return kept, budget
+
+
+def _record_prompt(memory, used):
+    memory_metrics["prompts"] += 1
+    memory_metrics["history_tokens"] += used
+    memory_metrics["raw_history_tokens"] += memory.covered_tokens + sum(turn.tokens for turn in memory.turns)
+
+
+def history_messages(memory, budget):
+    """Chat messages for a prompt: the summary if it fits, then the newest turns, within `budget` tokens"""
+    turns, remaining = _fit_turns(memory, budget)
+    messages = []
+    if memory.summary and memory.summary_tokens <= remaining:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {memory.summary}"})
+        remaining -= memory.summary_tokens
+    for turn in turns:
+        messages.append({"role": "user", "content": turn.message})
+        messages.append({"role": "assistant", "content": turn.response})
+    _record_prompt(memory, budget - remaining)
+    return messages
+
+
+def history_transcript(memory, budget):
+    """The same history as plain text, for prompts that quote it"""
+    turns, remaining = _fit_turns(memory, budget)
+    lines = []
+    if memory.summary and memory.summary_tokens <= remaining:
+        lines.append(f"Earlier: {memory.summary}")
+        remaining -= memory.summary_tokens
+    lines.extend(f"User: {turn.message}\nAssistant: {turn.response}" for turn in turns)
+    _record_prompt(memory, budget - remaining)
+    return "\n".join(lines)
+
+
+def schedule_summary_update(user_id, on_update=None):
+    """Fold older turns into the user's summary in the background.
+
+    `on_update` is called with the new ConversationSummary row, if one was written.
+    """
+    if user_id in _summarizing:
+        return
+    task = asyncio.create_task(update_summary(user_id))
+    _summarizing[user_id] = task
+
+    def done(task):
+        _summarizing.pop(user_id, None)
+        if on_update is not None and not task.cancelled() and task.result() is not None:
+            on_update(user_id, task.result())
+
+    task.add_done_callback(done)
+
+
+async def update_summary(user_id):
+    """Fold the oldest turns before the newest MEMORY_RECENT_TURNS into the summary, once they are worth it"""
+    try:
+        async with read_session() as session:
+            summary = await session.get(ConversationSummary, user_id)
+            covered_through = summary.covered_through if summary else 0
+            unsummarized = (Conversation.user_id == user_id, Conversation.id > covered_through)
+            result = await session.execute(
+                select(Conversation.id)
+                .where(*unsummarized)
+                .order_by(Conversation.timestamp.desc())
+                .limit(MEMORY_RECENT_TURNS)
+            )
+            recent_ids = list(result.scalars().all())
+
+            # Oldest turns first, up to MEMORY_SUMMARY_BATCH_TOKENS (always at least one)
+            turns = []
+            batch_tokens = 0
+            if len(recent_ids) == MEMORY_RECENT_TURNS:
+                result = await session.stream(
+                    select(Conversation)
+                    .where(*unsummarized, Conversation.id.not_in(recent_ids))
+                    .order_by(Conversation.timestamp)
+                )
+                async for conversation in result.scalars():
+                    turn = _turn(conversation)
+                    if turns and batch_tokens + turn.tokens > MEMORY_SUMMARY_BATCH_TOKENS:
+                        break
+                    turns.append(turn)
+                    batch_tokens += turn.tokens
+                await result.close()
+        new_tokens = sum(turn.tokens for turn in turns)
+        if not turns or new_tokens < MEMORY_SUMMARY_TRIGGER_TOKENS:
+            return None
+
+        # No session is held during the LLM call
+        transcript = "\n".join(f"User: {turn.message}\nAssistant: {turn.response}" for turn in turns)
+        previous = summary.summary if summary else "(none yet)"
+        response, _ = await cached_completion(
+            "memory_summary",
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": (
+                    "You maintain a compact memory of a user's conversations with a news assistant. "
+                    "Merge the new exchanges into the existing summary. Keep the user's interests, "
+                    "questions, opinions and anything they asked to follow up on. Drop small talk. "
+                    f"Answer with the updated summary only, in at most {MEMORY_SUMMARY_MAX_TOKENS} tokens."
+                )},
+                {"role": "user", "content": f"Existing summary:\n{previous}\n\nNew exchanges:\n{transcript}"},
+            ],
+            max_tokens=MEMORY_SUMMARY_MAX_TOKENS,
+            temperature=0.3
+        )
+        text = response.choices[0].message.content.strip()
+
+        values = {
+            "summary": text,
+            "tokens": count_tokens(text),
+            "covered_through": turns[-1].id,
+            "covered_tokens": ((summary.covered_tokens or 0) if summary else 0) + new_tokens,
+            "updated_at": datetime.utcnow(),
+        }
+        statement = dialect_insert(ConversationSummary.__table__).values(user_id=user_id, **values)
+        async with async_session() as session:
+            await session.execute(
+                statement.on_conflict_do_update(index_elements=["user_id"], set_=values)
+            )
+            await session.commit()
+        memory_metrics["summaries"] += 1
+        return ConversationSummary(user_id=user_id, **values)
+    except Exception as e:
+        memory_metrics["summary_errors"] += 1
+        logger.error(f"Error updating conversation summary for user {user_id}: {e}")
+        return None
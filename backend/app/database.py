@@ -1,27 +1,37 @@
 from datetime import datetime
 from typing import List, Optional
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Table, Text, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Table, Text, Boolean, UniqueConstraint, Index, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.future import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 import logging
+import random
+import time
 
+logger = logging.getLogger(__name__)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+from app.config import (
+    DATABASE_URL,
+    DATABASE_READ_URL,
+    DATABASE_POOL_SIZE,
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL_TIMEOUT,
+    DATABASE_POOL_RECYCLE,
+    SQLITE_READ_POOL_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
+    SLOW_QUERY_SECONDS,
+    SLOW_QUERY_LOG_SAMPLE_RATE,
+    DEFAULT_DIGEST_TIME,
+    DEFAULT_TIMEZONE,
 )
-logger = logging.getLogger("sqlalchemy.engine.Engine")
-class SQLSelectFilter(logging.Filter):
-    """Custom filter to allow only 'SELECT' log messages."""
-    def filter(self, record):
-        return 'SELECT' in record.getMessage()
-    
-# logger.addFilter(SQLSelectFilter())
-
-from app.config import DATABASE_URL
+from app.digest_buckets import utc_minute_of_day
 
 Base = declarative_base()
 
@@ -34,25 +44,31 @@ user_categories = Table(
 )
 
 
-# Many-to-many relationship between users and articles
+# Many-to-many relationship between users and articles. Superseded by the
+# interaction event log (app/interaction_log.py) and InteractionSummary;
+# kept for the relationships and for databases that still hold its rows.
 user_interactions = Table(
     "user_interactions",
     Base.metadata,
     Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
     Column("article_id", Integer, ForeignKey("articles.id"), primary_key=True),
     Column("interaction_type", String(20)),  # "view", "like", "dislike"
-    Column("timestamp", DateTime, default=datetime.utcnow)
+    Column("timestamp", DateTime, default=datetime.utcnow),
+    Index("ix_user_interactions_user_timestamp", "user_id", "timestamp"),
 )
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_digest_bucket", "digest_minute_utc", "is_active"),)
     
     id = Column(Integer, primary_key=True)
     telegram_id = Column(Integer, unique=True, index=True)
     first_name = Column(String(100))
     last_name = Column(String(100), nullable=True)
     username = Column(String(100), nullable=True)
-    digest_time = Column(String(5), default="08:00")  # Format: "HH:MM"
+    digest_time = Column(String(5), default="08:00")  # Format: "HH:MM", in the user's timezone
+    timezone = Column(String(64), default=DEFAULT_TIMEZONE)  # IANA name, e.g. "Europe/Berlin"
+    digest_minute_utc = Column(Integer)  # delivery bucket: digest_time as a UTC minute of the day
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_active = Column(DateTime, default=datetime.utcnow)
@@ -84,30 +100,199 @@ class Article(Base):
     published_at = Column(DateTime)
     source = Column(String(100))
     category_id = Column(Integer, ForeignKey("categories.id"))
+    simhash = Column(BigInteger)  # SimHash of title + summary
+    story_cluster = Column(BigInteger, index=True)  # shared by near-duplicate articles
     
     # Relationships
     category = relationship("Category", back_populates="articles")
     users = relationship("User", secondary=user_interactions, back_populates="interactions")  
 
+# Latest articles per category (get_recent_articles_by_category, the category cache)
+Index("ix_articles_category_published", Article.category_id, Article.published_at.desc())
+
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (Index("ix_conversations_user_timestamp", "user_id", "timestamp"),)
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     message = Column(Text)
     response = Column(Text)
+    tokens = Column(Integer, nullable=True)  # message + response, counted when saved
     timestamp = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="conversations")
 
-# Create async engine and session
-async_engine = create_async_engine(DATABASE_URL, echo=True)
+class ConversationSummary(Base):
+    """Rolling summary of a user's older conversation turns"""
+    __tablename__ = "conversation_summaries"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    summary = Column(Text)
+    tokens = Column(Integer)  # of the summary itself
+    covered_through = Column(Integer)  # id of the last conversation folded into it
+    covered_tokens = Column(Integer, default=0)  # raw tokens of the turns it replaces
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class Digest(Base):
+    """A digest generated ahead of its delivery time"""
+    __tablename__ = "digests"
+    __table_args__ = (UniqueConstraint("user_id", "scheduled_for"),)
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    scheduled_for = Column(DateTime, index=True)  # delivery time, UTC
+    text = Column(Text)
+    generated_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+class SchedulerRun(Base):
+    """Last run of each scheduled job, used to detect runs missed while down"""
+    __tablename__ = "scheduler_runs"
+    
+    job_name = Column(String(100), primary_key=True)
+    last_run_at = Column(DateTime)  # scheduled time, server clock
+
+class QueueJob(Base):
+    """Unit of work shared by all app instances through leases"""
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_claim", "kind", "status", "lease_expires_at"),)
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50))  # "digest", "ingest"
+    key = Column(String(255), unique=True)  # dedupes enqueues from several instances
+    payload = Column(Text)  # JSON
+    status = Column(String(20), default="pending")  # pending, leased, done, failed
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class InteractionSummary(Base):
+    """Per-user, per-article rollup of the interaction event log"""
+    __tablename__ = "interaction_summary"
+    __table_args__ = (Index("ix_interaction_summary_user_last", "user_id", "last_at"),)
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    article_id = Column(Integer, ForeignKey("articles.id"), primary_key=True)
+    last_type = Column(String(20))  # latest "view", "like" or "dislike"
+    views = Column(Integer, default=0)
+    likes = Column(Integer, default=0)
+    dislikes = Column(Integer, default=0)
+    last_at = Column(DateTime)
+
+class SchemaMigration(Base):
+    """Schema migrations applied to this database"""
+    __tablename__ = "schema_migrations"
+    
+    version = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+# Engine profiles
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+def engine_options(url, role="write"):
+    """create_async_engine keyword arguments for a database URL and role ("write" or "read")"""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        if _is_sqlite_memory(url):
+            # Every connection to :memory: is a separate database, so share one
+            return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+        # Sessions hold their connection across LLM calls, so the pool must cover
+        # every concurrent handler and digest generation. SQLite still allows
+        # one write transaction at a time; the busy timeout makes a contending
+        # writer wait for the lock instead of failing, and WAL keeps readers
+        # from blocking on writers
+        return {
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": DATABASE_POOL_SIZE if role == "write" else SQLITE_READ_POOL_SIZE,
+            "max_overflow": DATABASE_MAX_OVERFLOW,
+            "pool_timeout": DATABASE_POOL_TIMEOUT,
+            "connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        }
+    return {
+        "pool_size": DATABASE_POOL_SIZE,
+        "max_overflow": DATABASE_MAX_OVERFLOW,
+        "pool_timeout": DATABASE_POOL_TIMEOUT,
+        "pool_recycle": DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+def _set_sqlite_pragmas(engine, role):
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        if role == "read":
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+# Query counts and the slowest statement seen, across all engines
+query_metrics = {"queries": 0, "slow": 0, "max_seconds": 0.0}
+
+def _log_slow_queries(engine):
+    # The start time lives on the statement's execution context, so a statement
+    # that raises (and never reaches after_cursor_execute) leaves nothing behind
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        query_metrics["queries"] += 1
+        query_metrics["max_seconds"] = max(query_metrics["max_seconds"], round(elapsed, 4))
+        if elapsed >= SLOW_QUERY_SECONDS:
+            query_metrics["slow"] += 1
+            if random.random() < SLOW_QUERY_LOG_SAMPLE_RATE:
+                logger.warning(f"Slow query ({elapsed:.3f}s): {' '.join(statement.split())[:500]}")
+
+def create_engine_for(url, role="write"):
+    """Create an async engine with the profile for its backend and role"""
+    engine = create_async_engine(url, **engine_options(url, role))
+    if engine.dialect.name == "sqlite" and not _is_sqlite_memory(make_url(url)):
+        _set_sqlite_pragmas(engine, role)
+    _log_slow_queries(engine)
+    return engine
+
+# Create async engines and sessions. Writes (and reads that must see them)
+# use async_session; read-only queries that tolerate replica lag use read_session.
+async_engine = create_engine_for(DATABASE_URL)
 async_session = sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
 
+if DATABASE_READ_URL:
+    read_engine = create_engine_for(DATABASE_READ_URL, role="read")
+elif async_engine.dialect.name == "sqlite" and not _is_sqlite_memory(async_engine.url):
+    read_engine = create_engine_for(DATABASE_URL, role="read")
+else:
+    read_engine = async_engine  # Postgres pools already serve concurrent readers
+read_session = sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession)
+
 async def init_db():
+    """Create missing tables, then bring existing ones up to date"""
+    from app.migrations import run_migrations  # migrations use the models defined here
+    
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(async_engine)
+
+async def dispose_engines():
+    """Close pooled connections on shutdown"""
+    await async_engine.dispose()
+    if read_engine is not async_engine:
+        await read_engine.dispose()
 
 async def get_session():
     async with async_session() as session:
@@ -126,7 +311,10 @@ async def create_user(session, telegram_id, first_name, last_name=None, username
         telegram_id=telegram_id,
         first_name=first_name,
         last_name=last_name,
-        username=username
+        username=username,
+        digest_time=DEFAULT_DIGEST_TIME,
+        timezone=DEFAULT_TIMEZONE,
+        digest_minute_utc=utc_minute_of_day(DEFAULT_DIGEST_TIME, DEFAULT_TIMEZONE)
     )
     session.add(user)
     await session.commit()
@@ -153,4 +341,90 @@ async def save_article(session, title, url, summary, published_at, source, categ
     )
     session.add(article)
     await session.commit()
-    return article
\ No newline at end of file
+    return article
+
+# Bulk article operations
+BULK_INSERT_CHUNK_SIZE = 500
+
+# Category name -> id, shared by all batch writes (categories are never renamed or deleted)
+_category_ids = {}
+
+def dialect_insert(table):
+    """Dialect-specific INSERT that supports ON CONFLICT"""
+    if async_engine.dialect.name == "postgresql":
+        return postgresql_insert(table)
+    return sqlite_insert(table)
+
+async def get_category_ids(session, names):
+    """Resolve category names to ids from the in-memory map, creating missing categories"""
+    missing = {name for name in names if name not in _category_ids}
+    if missing:
+        await session.execute(
+            dialect_insert(Category.__table__)
+            .values([{"name": name} for name in missing])
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+        result = await session.execute(
+            select(Category.id, Category.name).where(Category.name.in_(missing))
+        )
+        for category_id, name in result:
+            _category_ids[name] = category_id
+    return {name: _category_ids[name] for name in names}
+
+async def save_articles(session, articles):
+    """Insert a batch of parsed articles, skipping known URLs, with a single commit.
+
+    Each article is a dict with title, url, summary, published_at, source,
+    category (a category name) and optionally simhash and story_cluster.
+    Returns the (id, url) pairs that were inserted.
+    """
+    if not articles:
+        return []
+
+    inserted = []
+    try:
+        category_ids = await get_category_ids(session, {article["category"] for article in articles})
+        for start in range(0, len(articles), BULK_INSERT_CHUNK_SIZE):
+            rows = [
+                {
+                    "title": article["title"],
+                    "url": article["url"],
+                    "summary": article["summary"],
+                    "published_at": article["published_at"],
+                    "source": article["source"],
+                    "category_id": category_ids[article["category"]],
+                    "simhash": article.get("simhash"),
+                    "story_cluster": article.get("story_cluster"),
+                }
+                for article in articles[start:start + BULK_INSERT_CHUNK_SIZE]
+            ]
+            result = await session.execute(
+                dialect_insert(Article.__table__)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=["url"])
+                .returning(Article.__table__.c.id, Article.__table__.c.url)
+            )
+            inserted.extend(result.all())
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        _category_ids.clear()
+        raise
+
+    return inserted
+
+# Digest operations
+async def save_digest(session, user_id, scheduled_for, text, sent_at=None):
+    """Store a generated digest; a digest already stored for the same delivery wins"""
+    await session.execute(
+        dialect_insert(Digest.__table__)
+        .values(
+            user_id=user_id,
+            scheduled_for=scheduled_for,
+            text=text,
+            generated_at=datetime.utcnow(),
+            sent_at=sent_at,
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "scheduled_for"])
+    )
+    await session.commit()
@@ -0,0 +1,135 @@
+"""Near-duplicate story detection with 64-bit SimHash.
+
+Articles whose title+summary fingerprints differ in at most MAX_DISTANCE bits
+are treated as the same story. The index splits each fingerprint into
+MAX_DISTANCE + 1 bands; by the pigeonhole principle any near-duplicate
+shares at least one band exactly, so a lookup only compares against the
+handful of fingerprints in the matching band buckets.
+
+Texts with fewer than DEDUP_MIN_WORDS words (e.g. a failed extraction with
+an empty title and summary) are not fingerprinted: they would all hash to
+the same few values and be merged into one bogus story.
+"""
+import hashlib
+import logging
+import re
+from datetime import datetime, timedelta
+from sqlalchemy.future import select
+
+from app.config import DEDUP_MAX_DISTANCE, DEDUP_WINDOW_DAYS, DEDUP_MIN_WORDS
+from app.database import Article
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+
+_WORD_RE = re.compile(r"\w+")
+_MASK64 = (1 << FINGERPRINT_BITS) - 1
+
+
+def to_signed(value):
+    """Unsigned 64-bit fingerprint to the signed value a BIGINT column can hold"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value):
+    return value & _MASK64
+
+
+def simhash(text):
+    """64-bit SimHash over the words of the text"""
+    # Word features keep short title+summary texts of the same story within a few bits,
+    # where shingles would let a single reworded phrase flip many bits
+    words = _WORD_RE.findall(text.lower())
+
+    votes = [0] * FINGERPRINT_BITS
+    for word in words:
+        digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(FINGERPRINT_BITS):
+            votes[bit] += 1 if digest >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, vote in enumerate(votes):
+        if vote > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def article_fingerprint(title, summary):
+    """SimHash of title + summary, or None if there are too few words to tell stories apart"""
+    text = f"{title or ''} {summary or ''}"
+    if len(_WORD_RE.findall(text)) < DEDUP_MIN_WORDS:
+        return None
+    return simhash(text)
+
+
+class SimHashIndex:
+    """Banded SimHash index mapping fingerprints to story clusters"""
+
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+        self._band_mask = (1 << self.band_bits) - 1
+        self._buckets = {}  # (band, band value) -> [(fingerprint, cluster)]
+        self.size = 0
+        self.loaded = False
+
+    def _keys(self, fingerprint):
+        for band in range(self.bands):
+            yield band, fingerprint >> (band * self.band_bits) & self._band_mask
+
+    def find(self, fingerprint):
+        """Cluster of the closest indexed fingerprint within max_distance, or None"""
+        best = None
+        for key in self._keys(fingerprint):
+            for candidate, cluster in self._buckets.get(key, ()):
+                distance = bin(candidate ^ fingerprint).count("1")
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, cluster)
+        return best[1] if best else None
+
+    def add(self, fingerprint, cluster):
+        for key in self._keys(fingerprint):
+            self._buckets.setdefault(key, []).append((fingerprint, cluster))
+        self.size += 1
+
+    def assign(self, fingerprint):
+        """Return the story cluster for a fingerprint, starting a new one if nothing is close"""
+        cluster = self.find(fingerprint)
+        if cluster is None:
+            cluster = fingerprint
+        self.add(fingerprint, cluster)
+        return cluster
+
+
+story_index = SimHashIndex()
+
+
+async def warm_story_index(session):
+    """Index fingerprints of articles published within the dedup window"""
+    since = datetime.utcnow() - timedelta(days=DEDUP_WINDOW_DAYS)
+    result = await session.stream(
+        select(Article.simhash, Article.story_cluster)
+        .where(Article.simhash.isnot(None), Article.published_at >= since)
+    )
+    async for partition in result.partitions(10000):
+        for fingerprint, cluster in partition:
+            story_index.add(to_unsigned(fingerprint), to_unsigned(cluster if cluster is not None else fingerprint))
+    story_index.loaded = True
+    logger.info(f"Story index warmed with {story_index.size} fingerprints")
+
+
+def assign_story_clusters(rows):
+    """Set simhash and story_cluster on article rows (dicts with title and summary).
+
+    Both stay None for rows with too little text, so each is its own story.
+    """
+    for row in rows:
+        fingerprint = article_fingerprint(row["title"], row["summary"])
+        if fingerprint is None:
+            row["simhash"] = row["story_cluster"] = None
+            continue
+        row["simhash"] = to_signed(fingerprint)
+        row["story_cluster"] = to_signed(story_index.assign(fingerprint))
+    return rows
@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_
+from sqlalchemy.future import select
+from telegram.constants import ParseMode
+
+from app.config import (
+    DIGEST_GENERATION_CONCURRENCY,
+    DIGEST_PREGENERATE_LEAD,
+    DIGEST_PATCH_NEW_ARTICLES,
+    DIGEST_PATCH_MAX_ARTICLES,
+)
+from app.database import async_session, read_session, User, Digest, save_digest
+from app.article_cache import category_cache
+from app.command_handler import convert_markdown_to_markdown_v2
+from app.digest_buckets import utc_minute_of_day, to_utc, bucket_ranges, slot_for_bucket
+from app.job_queue import enqueue_jobs, claim_jobs, complete_jobs, fail_jobs, hold_leases
+from app.recommendation import generate_digest_for_user, new_digest_metrics
+from app.telegram_bot import send_message
+
+logger = logging.getLogger(__name__)
+
+# Stats for the most recent digest run and pre-generation tick
+delivery_metrics = {}
+pregeneration_metrics = {}
+_pregeneration_running = False
+
+
+async def refresh_digest_buckets(scheduled_for=None):
+    """Recompute UTC delivery buckets, e.g. after a DST change, and fill in missing ones.
+
+    Users are grouped by (timezone, digest_time), so this is one UPDATE per
+    distinct combination rather than per user.
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            select(User.timezone, User.digest_time).distinct()
+        )
+        changed = 0
+        for timezone_name, digest_time in result.all():
+            if not digest_time:
+                continue
+            try:
+                bucket = utc_minute_of_day(digest_time, timezone_name)
+            except Exception as e:
+                logger.error(f"Invalid digest time {digest_time!r} / timezone {timezone_name!r}: {e}")
+                continue
+            timezone_filter = (
+                User.timezone == timezone_name if timezone_name is not None else User.timezone.is_(None)
+            )
+            update_result = await session.execute(
+                update(User)
+                .where(
+                    timezone_filter,
+                    User.digest_time == digest_time,
+                    or_(User.digest_minute_utc.is_(None), User.digest_minute_utc != bucket),
+                )
+                .values(digest_minute_utc=bucket)
+            )
+            changed += update_result.rowcount or 0
+        await session.commit()
+    if changed:
+        logger.info(f"Updated delivery buckets of {changed} users")
+
+
+def pregeneration_query(first, last, now):
+    """Active users in buckets [first, last] without a digest for an upcoming slot yet"""
+    already_generated = select(Digest.user_id).where(Digest.scheduled_for > now)
+    return select(User.id, User.digest_minute_utc).where(
+        User.digest_minute_utc.between(first, last),
+        User.is_active == True,
+        User.id.not_in(already_generated),
+    )
+
+
+async def pregenerate_digests(now=None):
+    """Generate digests due within DIGEST_PREGENERATE_LEAD minutes and store them.
+
+    Each tick only takes an even share of every upcoming slot's users, so LLM
+    calls are spread across the lead time instead of spiking at :00 and :30.
+    The share goes through the shared job queue like delivery: every instance
+    enqueues the same (user, slot) jobs, and each digest is generated by the
+    one worker that claims it.
+    """
+    global _pregeneration_running
+    if _pregeneration_running:
+        logger.info("Previous digest pre-generation still running, skipping this tick")
+        return
+    _pregeneration_running = True
+    llm_metrics = new_digest_metrics()
+    try:
+        now = to_utc(now or datetime.now()).replace(second=0, microsecond=0)
+        end = now + timedelta(minutes=DIGEST_PREGENERATE_LEAD)
+
+        async with async_session() as session:
+            pending = []
+            for first, last in bucket_ranges(now, end):
+                result = await session.execute(pregeneration_query(first, last, now))
+                pending.extend(result.all())
+
+        by_slot = {}
+        for user_id, bucket in pending:
+            by_slot.setdefault(slot_for_bucket(bucket, end), []).append(user_id)
+
+        jobs = []
+        for slot, user_ids in by_slot.items():
+            user_ids.sort()  # every instance enqueues the same share
+            minutes_left = int((slot - now).total_seconds() // 60)
+            # The minute right before delivery is left as slack
+            quota = math.ceil(len(user_ids) / max(1, minutes_left - 1))
+            jobs.extend(
+                (f"pregenerate:{user_id}:{slot.isoformat()}", {"user_id": user_id, "scheduled_for": slot.isoformat()})
+                for user_id in user_ids[:quota]
+            )
+        await enqueue_jobs("pregenerate", jobs)
+
+        generation_slots = asyncio.Semaphore(DIGEST_GENERATION_CONCURRENCY)
+        started = time.monotonic()
+        counts = {"claimed": 0, "generated": 0, "failed": 0}
+
+        async def pregenerate(job_id, user_id, slot):
+            try:
+                async with generation_slots:
+                    # Generation only reads; the write session is opened just for the insert
+                    async with read_session() as session:
+                        digest = await generate_digest_for_user(user_id, session, llm_metrics)
+                    if digest:
+                        async with async_session() as session:
+                            await save_digest(session, user_id, slot, digest)
+                if digest:
+                    counts["generated"] += 1
+                    await complete_jobs([job_id])
+                else:
+                    counts["failed"] += 1
+                    await fail_jobs([job_id], "no digest generated")
+            except Exception as e:
+                counts["failed"] += 1
+                logger.error(f"Error pre-generating digest for user {user_id}: {e}")
+                await fail_jobs([job_id], str(e))
+
+        # Claim only what this instance can generate at once, so others share the work
+        cache_checked = False
+        while True:
+            claimed = await claim_jobs("pregenerate", DIGEST_GENERATION_CONCURRENCY)
+            if not claimed:
+                break
+            if not cache_checked:
+                # Ingestion may have run on another instance
+                await category_cache.refresh_if_stale()
+                cache_checked = True
+            counts["claimed"] += len(claimed)
+            async with hold_leases([job_id for job_id, _ in claimed]):
+                await asyncio.gather(*(
+                    pregenerate(job_id, payload["user_id"], datetime.fromisoformat(payload["scheduled_for"]))
+                    for job_id, payload in claimed
+                ))
+
+        pregeneration_metrics.update(
+            pending=len(pending),
+            enqueued=len(jobs),
+            claimed=counts["claimed"],
+            generated=counts["generated"],
+            failed=counts["failed"],
+            seconds=round(time.monotonic() - started, 2),
+            tick=now,
+            llm=llm_metrics,
+        )
+        if counts["claimed"]:
+            logger.info(f"Digest pre-generation tick: {pregeneration_metrics}")
+    finally:
+        _pregeneration_running = False
+
+
+async def patch_digest(user, digest):
+    """Append stories from the user's categories published after the digest was generated"""
+    fresh = []
+    for category in user.categories:
+        for article in await category_cache.get(category.name, DIGEST_PATCH_MAX_ARTICLES) or []:
+            if article.published_at and article.published_at > digest.generated_at and article.url not in digest.text:
+                fresh.append(article)
+    if not fresh:
+        return digest.text
+
+    fresh.sort(key=lambda article: article.published_at, reverse=True)
+    lines = ["", "**Just in**"]
+    for article in fresh[:DIGEST_PATCH_MAX_ARTICLES]:
+        lines.append(f"- {article.title} ([Read more]({article.url}))")
+    return digest.text + "\n".join(lines)
+
+
+async def deliver_digests(deliveries, failures=None):
+    """Send digests for (user, scheduled_for) pairs, using pre-generated digests where available.
+
+    `scheduled_for` is the UTC delivery slot (or None for an ad-hoc send).
+    Digests already sent for a slot are skipped; users without a stored
+    digest get one generated on the spot, with bounded concurrency. Users
+    must have categories loaded. If `failures` is a dict, it receives an
+    error message for each user id that could not be delivered.
+    """
+    if failures is None:
+        failures = {}
+    generation_slots = asyncio.Semaphore(DIGEST_GENERATION_CONCURRENCY)
+    started = time.monotonic()
+    counts = {"sent": 0, "failed": 0, "pregenerated": 0}
+    llm_metrics = new_digest_metrics()
+
+    stored = {}
+    slots = {scheduled_for for _, scheduled_for in deliveries if scheduled_for is not None}
+    if slots:
+        async with async_session() as session:
+            result = await session.execute(
+                select(Digest).where(
+                    Digest.scheduled_for.in_(slots),
+                    Digest.user_id.in_([user.id for user, _ in deliveries]),
+                )
+            )
+            stored = {(digest.user_id, digest.scheduled_for): digest for digest in result.scalars().all()}
+    sent_digest_ids = []
+
+    async def deliver(user, scheduled_for):
+        try:
+            digest = stored.get((user.id, scheduled_for))
+            if digest is not None and digest.sent_at is not None:
+                return  # already delivered, e.g. before a restart during catch-up
+            if digest is not None:
+                text = await patch_digest(user, digest) if DIGEST_PATCH_NEW_ARTICLES else digest.text
+                counts["pregenerated"] += 1
+            else:
+                async with generation_slots:
+                    async with read_session() as session:
+                        text = await generate_digest_for_user(user.id, session, llm_metrics)
+
+            if text:
+                await send_message(
+                    user.telegram_id,
+                    convert_markdown_to_markdown_v2(text),
+                    parse_mode=ParseMode.MARKDOWN_V2
+                )
+                counts["sent"] += 1
+                logger.info(f"Sent digest to user {user.id}")
+                if digest is not None:
+                    sent_digest_ids.append(digest.id)
+                elif scheduled_for is not None:
+                    async with async_session() as session:
+                        await save_digest(session, user.id, scheduled_for, text, sent_at=datetime.utcnow())
+            else:
+                counts["failed"] += 1
+                failures[user.id] = "no digest generated"
+                logger.error(f"Failed to generate digest for user {user.id}")
+        except Exception as e:
+            counts["failed"] += 1
+            failures[user.id] = str(e)
+            logger.error(f"Error sending digest to user {user.id}: {e}")
+
+    await asyncio.gather(*(deliver(user, scheduled_for) for user, scheduled_for in deliveries))
+
+    if sent_digest_ids:
+        async with async_session() as session:
+            await session.execute(
+                update(Digest).where(Digest.id.in_(sent_digest_ids)).values(sent_at=datetime.utcnow())
+            )
+            await session.commit()
+
+    elapsed = time.monotonic() - started
+    delivery_metrics.update(
+        users=len(deliveries),
+        sent=counts["sent"],
+        failed=counts["failed"],
+        pregenerated=counts["pregenerated"],
+        seconds=round(elapsed, 2),
+        messages_per_sec=round(counts["sent"] / elapsed, 2) if elapsed > 0 else 0.0,
+        llm=llm_metrics,
+    )
+    logger.info(f"Digest delivery finished: {delivery_metrics}")
+    return delivery_metrics
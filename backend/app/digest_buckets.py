@@ -0,0 +1,66 @@
+"""Digest delivery buckets.
+
+A user's local "HH:MM" digest time in their IANA timezone is stored as a UTC
+minute of the day (0-1439), so a single indexed range scan finds everyone
+due in a window regardless of timezone.
+"""
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from app.config import DEFAULT_TIMEZONE
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def is_valid_timezone(name):
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def utc_minute_of_day(digest_time, timezone_name=None, on=None):
+    """UTC minute of the day at which a local "HH:MM" time falls on the given local date (default today)"""
+    hour, minute = map(int, digest_time.split(":"))
+    zone = ZoneInfo(timezone_name or DEFAULT_TIMEZONE)
+    day = on or datetime.now(zone).date()
+    local = datetime.combine(day, time(hour, minute), tzinfo=zone)
+    utc = local.astimezone(timezone.utc)
+    return utc.hour * 60 + utc.minute
+
+
+def to_utc(moment):
+    """Naive server-local datetime (or aware datetime) to naive UTC"""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def minute_of_day(moment):
+    return moment.hour * 60 + moment.minute
+
+
+def bucket_ranges(start, end):
+    """Inclusive minute-of-day ranges covering the UTC window (start, end].
+
+    A window crossing midnight yields two ranges; windows of a day or more
+    are clamped to one full day.
+    """
+    start = start.replace(second=0, microsecond=0)
+    end = end.replace(second=0, microsecond=0)
+    if end <= start:
+        return []
+    if end - start >= timedelta(days=1):
+        return [(0, MINUTES_PER_DAY - 1)]
+    first = minute_of_day(start + timedelta(minutes=1))
+    last = minute_of_day(end)
+    if first <= last:
+        return [(first, last)]
+    return [(first, MINUTES_PER_DAY - 1), (0, last)]
+
+
+def slot_for_bucket(bucket, end):
+    """Latest UTC datetime at or before `end` whose minute of the day is `bucket`"""
+    slot = end.replace(hour=bucket // 60, minute=bucket % 60, second=0, microsecond=0)
+    if slot > end:
+        slot -= timedelta(days=1)
+    return slot
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from app.config import HTTP_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class HttpCache:
+    """On-disk store of response validators and bodies for conditional GETs"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0  # 304 Not Modified
+        self.misses = 0  # full 200 responses
+        self.bytes_saved = 0
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return (
+            os.path.join(self.directory, f"{key}.json"),
+            os.path.join(self.directory, f"{key}.body"),
+        )
+
+    def _load(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        return meta, body
+
+    def _store(self, url, meta, body):
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path, body_path = self._paths(url)
+        with open(body_path, "wb") as f:
+            f.write(body)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+
+    async def get(self, client, url, pending=None):
+        """GET a URL, revalidating any cached copy.
+
+        Returns (text, content, modified): the decoded body, the raw bytes
+        (for parsers that honor the document's own encoding declaration) and
+        whether it changed. On a 304 the cached body is returned with
+        modified=False so callers can skip re-parsing it. If `pending` is a
+        dict, new validators are collected there instead of being stored, and
+        only reach the cache through save() once the caller has acted on the
+        body; otherwise a failure after a 200 would turn into a 304 next time.
+        """
+        meta, body = await asyncio.to_thread(self._load, url)
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = await client.get(url, headers=headers)
+        if response.status_code == 304 and body is not None:
+            self.hits += 1
+            self.bytes_saved += len(body)
+            return body.decode(meta.get("encoding") or "utf-8", errors="replace"), body, False
+
+        response.raise_for_status()
+        self.misses += 1
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            new_meta = {
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "encoding": response.encoding,
+            }
+            if pending is not None:
+                pending[url] = (new_meta, response.content)
+            else:
+                await asyncio.to_thread(self._store, url, new_meta, response.content)
+        return response.text, response.content, True
+
+    async def save(self, pending):
+        """Store validators collected by get(..., pending=...)"""
+        for url, (meta, body) in pending.items():
+            await asyncio.to_thread(self._store, url, meta, body)
+
+    def metrics(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+http_cache = HttpCache(HTTP_CACHE_DIR)
@@ -0,0 +1,220 @@
+"""Append-only log of user interactions with articles.
+
+Recording an interaction (a view, like or dislike) only appends to an
+in-memory buffer, so handlers never wait on the database. The buffer is
+written in batches, when it reaches INTERACTION_FLUSH_SIZE events or every
+INTERACTION_FLUSH_SECONDS. Each flush makes one multi-row insert into the
+current month's event table and one upsert into InteractionSummary, the
+compact per-user, per-article view that readers query.
+
+Events are validated when recorded. If a batch fails to write, its events
+are retried one by one, so a single bad event (e.g. an article that was
+deleted) cannot block the rest; events that keep failing are dropped after
+INTERACTION_MAX_ATTEMPTS flushes.
+
+Event tables rotate monthly (interaction_events_YYYYMM). Tables older than
+INTERACTION_RETENTION_MONTHS are dropped as a whole, so the log never
+needs a slow bulk DELETE.
+"""
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, inspect, text
+
+from app.config import (
+    INTERACTION_FLUSH_SIZE,
+    INTERACTION_FLUSH_SECONDS,
+    INTERACTION_BUFFER_MAX,
+    INTERACTION_RETENTION_MONTHS,
+    INTERACTION_MAX_ATTEMPTS,
+)
+from app.database import async_session, InteractionSummary, dialect_insert
+from app.user_context import user_contexts
+
+logger = logging.getLogger(__name__)
+
+EVENT_TABLE_PREFIX = "interaction_events_"
+INTERACTION_TYPES = ("view", "like", "dislike")
+
+# Event tables are created on demand, outside Base.metadata
+_event_metadata = MetaData()
+
+
+def event_table(month):
+    """Table holding the events of a month, given as "YYYYMM" """
+    name = f"{EVENT_TABLE_PREFIX}{month}"
+    if name not in _event_metadata.tables:
+        Table(
+            name,
+            _event_metadata,
+            Column("id", Integer, primary_key=True),
+            Column("user_id", Integer, index=True),
+            Column("article_id", Integer),
+            Column("interaction_type", String(20)),
+            Column("created_at", DateTime),
+        )
+    return _event_metadata.tables[name]
+
+
+def _months_before(month, count):
+    year, month_number = divmod(int(month[:4]) * 12 + int(month[4:]) - 1 - count, 12)
+    return f"{year:04d}{month_number + 1:02d}"
+
+
+class InteractionLog:
+    """In-memory buffer of interaction events, written to the database in batches"""
+
+    def __init__(self, flush_size=INTERACTION_FLUSH_SIZE, flush_seconds=INTERACTION_FLUSH_SECONDS,
+                 max_buffered=INTERACTION_BUFFER_MAX):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._buffer = deque(maxlen=max_buffered)
+        self._lock = asyncio.Lock()
+        self._flush_task = None
+        self._timer_task = None
+        self._ready_months = set()  # months whose event table exists
+        self._stats = {"recorded": 0, "written": 0, "flushes": 0, "errors": 0, "rejected": 0, "dropped": 0}
+
+    def record(self, user_id, article_id, interaction_type):
+        """Buffer an interaction; never touches the database.
+
+        Returns False, without buffering, for an event that could never be written.
+        """
+        try:
+            user_id = int(user_id)
+            article_id = int(article_id)
+        except (TypeError, ValueError):
+            user_id = article_id = None
+        if user_id is None or interaction_type not in INTERACTION_TYPES:
+            self._stats["rejected"] += 1
+            logger.warning(f"Ignoring invalid interaction {interaction_type!r} on article {article_id!r}")
+            return False
+
+        if len(self._buffer) == self._buffer.maxlen:
+            logger.warning("Interaction buffer is full, dropping the oldest event")
+        self._buffer.append((user_id, article_id, interaction_type, datetime.utcnow(), 0))
+        self._stats["recorded"] += 1
+        if len(self._buffer) >= self.flush_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+        return True
+
+    def start(self):
+        self._timer_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the timer and write out whatever is still buffered"""
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            await asyncio.gather(self._timer_task, return_exceptions=True)
+            self._timer_task = None
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    async def flush(self):
+        """Write buffered events and their rollup in one transaction"""
+        async with self._lock:
+            if not self._buffer:
+                return
+            events = list(self._buffer)
+            self._buffer.clear()
+            try:
+                await self._write(events)
+                self._stats["written"] += len(events)
+                self._stats["flushes"] += 1
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.error(f"Error writing {len(events)} interaction events, retrying one by one: {e}")
+                retry = await self._write_each(events)
+                # Keep them for the next flush, ahead of anything recorded meanwhile
+                self._buffer.extendleft(reversed(retry))
+
+    async def _write_each(self, events):
+        """Write events one at a time; return the failed ones that may be retried"""
+        retry = []
+        for event in events:
+            try:
+                await self._write([event])
+                self._stats["written"] += 1
+            except Exception as e:
+                attempts = event[-1] + 1
+                if attempts < INTERACTION_MAX_ATTEMPTS:
+                    retry.append(event[:-1] + (attempts,))
+                else:
+                    self._stats["dropped"] += 1
+                    logger.error(f"Dropping interaction event {event[:-1]} after {attempts} failed writes: {e}")
+        return retry
+
+    async def _write(self, events):
+        by_month = {}
+        rollup = {}
+        for user_id, article_id, interaction_type, created_at, _ in events:
+            by_month.setdefault(created_at.strftime("%Y%m"), []).append({
+                "user_id": user_id,
+                "article_id": article_id,
+                "interaction_type": interaction_type,
+                "created_at": created_at,
+            })
+            row = rollup.setdefault((user_id, article_id), {
+                "user_id": user_id, "article_id": article_id, "views": 0, "likes": 0, "dislikes": 0,
+            })
+            if interaction_type == "view":
+                row["views"] += 1
+            elif interaction_type == "like":
+                row["likes"] += 1
+            elif interaction_type == "dislike":
+                row["dislikes"] += 1
+            row["last_type"] = interaction_type
+            row["last_at"] = created_at
+
+        for month in by_month.keys() - self._ready_months:
+            await self._rotate(month)
+
+        async with async_session() as session:
+            for month, rows in by_month.items():
+                await session.execute(event_table(month).insert(), rows)
+            statement = dialect_insert(InteractionSummary.__table__).values(list(rollup.values()))
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["user_id", "article_id"],
+                    set_={
+                        "views": InteractionSummary.views + statement.excluded.views,
+                        "likes": InteractionSummary.likes + statement.excluded.likes,
+                        "dislikes": InteractionSummary.dislikes + statement.excluded.dislikes,
+                        "last_type": statement.excluded.last_type,
+                        "last_at": statement.excluded.last_at,
+                    },
+                )
+            )
+            await session.commit()
+
+        # Recent articles in cached reply contexts are now out of date
+        for user_id in {user_id for user_id, _ in rollup}:
+            user_contexts.invalidate(user_id=user_id)
+
+    async def _rotate(self, month):
+        """Create the event table for a month and drop tables past retention"""
+        cutoff = f"{EVENT_TABLE_PREFIX}{_months_before(month, INTERACTION_RETENTION_MONTHS)}"
+
+        def rotate(conn):
+            event_table(month).create(conn, checkfirst=True)
+            for name in inspect(conn).get_table_names():
+                if name.startswith(EVENT_TABLE_PREFIX) and name < cutoff:
+                    logger.info(f"Dropping expired interaction table {name}")
+                    conn.execute(text(f"DROP TABLE {name}"))
+
+        async with async_session() as session:
+            connection = await session.connection()
+            await connection.run_sync(rotate)
+            await session.commit()
+        self._ready_months.add(month)
+
+    def metrics(self):
+        return {**self._stats, "buffered": len(self._buffer)}
+
+
+interaction_log = InteractionLog()
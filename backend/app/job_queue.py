@@ -0,0 +1,169 @@
+"""Database-backed job queue with leases.
+
+Every app instance may enqueue the same work; unique job keys make that
+idempotent. Workers claim batches by setting a lease: on Postgres the
+candidate rows are picked with SELECT ... FOR UPDATE SKIP LOCKED, and on
+SQLite the claim is a single UPDATE, which SQLite's database write lock
+serializes. Jobs whose lease expired (a worker died) are claimed again.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import update, delete, or_, and_
+from sqlalchemy.future import select
+
+from app.config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_RETENTION_HOURS
+from app.database import async_engine, async_session, QueueJob, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process as a lease owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def enqueue_jobs(kind, jobs):
+    """Add (key, payload) jobs, ignoring keys that were already enqueued by anyone"""
+    if not jobs:
+        return
+    async with async_session() as session:
+        await session.execute(
+            dialect_insert(QueueJob.__table__)
+            .values([
+                {
+                    "kind": kind,
+                    "key": key,
+                    "payload": json.dumps(payload, default=str),
+                    "status": "pending",
+                    "attempts": 0,
+                    "created_at": datetime.utcnow(),
+                }
+                for key, payload in jobs
+            ])
+            .on_conflict_do_nothing(index_elements=["key"])
+        )
+        await session.commit()
+
+
+async def claim_jobs(kind, limit, lease_seconds=JOB_LEASE_SECONDS):
+    """Lease up to `limit` runnable jobs of a kind to this worker; returns (id, payload) pairs"""
+    now = datetime.utcnow()
+    runnable = (
+        select(QueueJob.id)
+        .where(
+            QueueJob.kind == kind,
+            or_(
+                QueueJob.status == "pending",
+                and_(QueueJob.status == "leased", QueueJob.lease_expires_at < now),
+            ),
+        )
+        .order_by(QueueJob.id)
+        .limit(limit)
+    )
+    if async_engine.dialect.name == "postgresql":
+        runnable = runnable.with_for_update(skip_locked=True)
+
+    async with async_session() as session:
+        result = await session.execute(
+            update(QueueJob)
+            .where(QueueJob.id.in_(runnable.scalar_subquery()))
+            .values(
+                status="leased",
+                lease_owner=WORKER_ID,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                attempts=QueueJob.attempts + 1,
+            )
+            .returning(QueueJob.id, QueueJob.payload)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = [(job_id, json.loads(payload)) for job_id, payload in result.all()]
+        await session.commit()
+    return claimed
+
+
+async def renew_lease(job_ids, lease_seconds=JOB_LEASE_SECONDS):
+    """Extend this worker's leases on long-running jobs"""
+    async with async_session() as session:
+        await session.execute(
+            update(QueueJob)
+            .where(QueueJob.id.in_(job_ids), QueueJob.lease_owner == WORKER_ID, QueueJob.status == "leased")
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+
+@asynccontextmanager
+async def hold_leases(job_ids, lease_seconds=JOB_LEASE_SECONDS):
+    """Keep renewing this worker's leases on `job_ids` while the block runs.
+
+    Jobs may run longer than one lease (a slow source refresh, a large digest
+    batch); without renewal another worker would take them over mid-run.
+    """
+    async def renew_periodically():
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            try:
+                await renew_lease(job_ids, lease_seconds)
+            except Exception as e:
+                logger.error(f"Error renewing leases on {len(job_ids)} jobs: {e}")
+
+    renewer = asyncio.create_task(renew_periodically())
+    try:
+        yield
+    finally:
+        renewer.cancel()
+        await asyncio.gather(renewer, return_exceptions=True)
+
+
+async def complete_jobs(job_ids):
+    """Mark jobs done, unless their lease was lost to another worker"""
+    if not job_ids:
+        return
+    async with async_session() as session:
+        await session.execute(
+            update(QueueJob)
+            .where(QueueJob.id.in_(job_ids), QueueJob.lease_owner == WORKER_ID)
+            .values(status="done", finished_at=datetime.utcnow(), lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+
+async def fail_jobs(job_ids, error):
+    """Return jobs to the queue for another attempt, or mark them failed after JOB_MAX_ATTEMPTS"""
+    if not job_ids:
+        return
+    async with async_session() as session:
+        owned = and_(QueueJob.id.in_(job_ids), QueueJob.lease_owner == WORKER_ID)
+        await session.execute(
+            update(QueueJob)
+            .where(owned, QueueJob.attempts >= JOB_MAX_ATTEMPTS)
+            .values(status="failed", finished_at=datetime.utcnow(), last_error=error)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            update(QueueJob)
+            .where(owned, QueueJob.attempts < JOB_MAX_ATTEMPTS)
+            .values(status="pending", lease_owner=None, lease_expires_at=None, last_error=error)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+
+async def purge_finished_jobs(scheduled_for=None):
+    """Delete done and failed jobs older than JOB_RETENTION_HOURS"""
+    cutoff = datetime.utcnow() - timedelta(hours=JOB_RETENTION_HOURS)
+    async with async_session() as session:
+        result = await session.execute(
+            delete(QueueJob)
+            .where(QueueJob.status.in_(["done", "failed"]), QueueJob.finished_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    if result.rowcount:
+        logger.info(f"Purged {result.rowcount} finished jobs")
@@ -0,0 +1,178 @@
+"""Shared LLM client with a content-addressed response cache.
+
+Responses are keyed by a hash of the model, messages and parameters, kept in
+an in-memory LRU and optionally in an on-disk SQLite table, and expire after
+a TTL chosen per call site. Concurrent identical requests share one call.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from litellm import acompletion, ModelResponse
+
+from app.config import LLM_CACHE_MAX_ENTRIES, LLM_CACHE_PATH, LLM_CACHE_TTLS
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    """LRU of key -> (expires_at, entry)"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    async def get(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key, entry, ttl):
+        self._entries[key] = (time.time() + ttl, entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SqliteCache:
+    """Entries persisted in a SQLite file so they survive restarts"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, expires_at REAL, entry TEXT)"
+            )
+        return self._conn
+
+    def _get(self, key):
+        row = self._connect().execute(
+            "SELECT entry FROM llm_cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key, entry, ttl):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, expires_at, entry) VALUES (?, ?, ?)",
+                (key, time.time() + ttl, json.dumps(entry, default=str)),
+            )
+            conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, entry, ttl):
+        await asyncio.to_thread(self._set, key, entry, ttl)
+
+
+_memory = MemoryCache(LLM_CACHE_MAX_ENTRIES)
+_disk = SqliteCache(LLM_CACHE_PATH) if LLM_CACHE_PATH else None
+_in_flight = {}
+
+# Per call site: hits, misses, latency saved (seconds)
+llm_cache_stats = {}
+
+
+def cache_key(model, messages, params):
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _record(call_site, hit, latency_saved=0.0):
+    stats = llm_cache_stats.setdefault(call_site, {"hits": 0, "misses": 0, "latency_saved": 0.0})
+    stats["hits" if hit else "misses"] += 1
+    stats["latency_saved"] += latency_saved
+
+
+def cache_metrics():
+    """Hit rate and latency saved per call site"""
+    return {
+        call_site: {
+            **stats,
+            "hit_rate": round(stats["hits"] / (stats["hits"] + stats["misses"]), 3)
+            if stats["hits"] + stats["misses"] else 0.0,
+            "latency_saved": round(stats["latency_saved"], 2),
+        }
+        for call_site, stats in llm_cache_stats.items()
+    }
+
+
+async def _lookup(key):
+    entry = await _memory.get(key)
+    if entry is None and _disk is not None:
+        entry = await _disk.get(key)
+        if entry is not None:
+            await _memory.set(key, entry, max(0.0, entry["expires_at"] - time.time()))
+    return entry
+
+
+async def cached_completion(call_site, model, messages, ttl=None, **params):
+    """litellm.acompletion through the response cache.
+
+    `call_site` selects the TTL from LLM_CACHE_TTLS unless `ttl` is given; a
+    TTL of 0 bypasses the cache. Returns (response, cached).
+    """
+    ttl = LLM_CACHE_TTLS.get(call_site, 0) if ttl is None else ttl
+    if ttl <= 0:
+        return await acompletion(model=model, messages=messages, **params), False
+
+    key = cache_key(model, messages, params)
+    entry = await _lookup(key)
+    if entry is not None:
+        _record(call_site, hit=True, latency_saved=entry["latency"])
+        return ModelResponse(**entry["response"]), True
+
+    # Identical requests already in flight wait for that call instead of making their own
+    in_flight = _in_flight.get(key)
+    if in_flight is not None:
+        entry = await asyncio.shield(in_flight)
+        _record(call_site, hit=True, latency_saved=entry["latency"])
+        return ModelResponse(**entry["response"]), True
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        started = time.monotonic()
+        response = await acompletion(model=model, messages=messages, **params)
+        entry = {
+            "response": response.model_dump(),
+            "latency": time.monotonic() - started,
+            "expires_at": time.time() + ttl,
+        }
+        await _memory.set(key, entry, ttl)
+        if _disk is not None:
+            try:
+                await _disk.set(key, entry, ttl)
+            except Exception as e:
+                logger.error(f"Error writing LLM cache entry to disk: {e}")
+        _record(call_site, hit=False)
+        future.set_result(entry)
+        return response, False
+    except BaseException as e:
+        # Also on cancellation, so callers waiting on this request never hang;
+        # they get an ordinary error rather than a cancellation of their own
+        future.set_exception(e if isinstance(e, Exception) else RuntimeError("LLM request was cancelled"))
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        del _in_flight[key]
@@ -1,11 +1,19 @@
 import logging
-from fastapi import FastAPI, Request, Depends
-from app.config import TELEGRAM_TOKEN, WEBHOOK_URL
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.config import TELEGRAM_TOKEN, WEBHOOK_URL, WEBHOOK_SECRET, UPDATE_MODE
 from contextlib import asynccontextmanager
-from app.telegram_handler import bot, process_telegram_update
-from app.database import init_db, get_session
-from app.scheduler import start_scheduler, stop_scheduler
+from app.telegram_handler import bot
+from app.update_queue import update_queue
+from app.polling import polling_runner
+from app.interaction_log import interaction_log
+from app.database import init_db, async_session, dispose_engines
+from app.scheduler import start_scheduler, stop_scheduler, scheduler_metrics
+from app.news_service import shutdown_ingestion, ingest_metrics
+from app.url_index import warm_seen_urls
+from app.dedup import warm_story_index
+from app.article_cache import category_cache
+from app.llm_client import cache_metrics
 from telegram import Bot, Update
 
 import nltk
@@ -27,15 +35,28 @@ async def lifespan(app: FastAPI):
     """Manage startup and shutdown events."""
     # Initialize database
     await init_db()
-    await bot.set_webhook(f"{WEBHOOK_URL}/webhook")
+    async with async_session() as session:
+        await warm_seen_urls(session)
+        await warm_story_index(session)
+    update_queue.start()
+    interaction_log.start()
+    if UPDATE_MODE == "polling":
+        await polling_runner.start()
+    else:
+        await bot.set_webhook(f"{WEBHOOK_URL}/webhook", secret_token=WEBHOOK_SECRET)
     # Start the scheduler
-    # start_scheduler() # Run it only once at application startup
+    # await start_scheduler() # Run it only once at application startup
     logger.info("Application started")
     
     try:
         yield  # Application is running
     finally:
-        stop_scheduler()
+        await polling_runner.stop()
+        await update_queue.stop()
+        await interaction_log.stop()
+        await stop_scheduler()
+        await shutdown_ingestion()
+        await dispose_engines()
 
 app = FastAPI(title="News Digest Telegram Bot", lifespan=lifespan)
 
@@ -48,21 +69,58 @@ async def root():
 
 
 @app.post("/webhook")
-async def telegram_webhook(request: Request, session: AsyncSession = Depends(get_session)):
-    # Get the Telegram update as JSON
-    update_data = await request.json()
-    logger.info(f"Received Telegram update: {update_data}")
+async def telegram_webhook(request: Request):
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return JSONResponse({"status": "forbidden"}, status_code=403)
     
-    # Process the update
+    # Get the Telegram update as JSON
     try:
-        await process_telegram_update(update_data, session)
-    except Exception as e:
-        logger.error(f"Error processing update: {e}", exc_info=True)
+        update_data = await request.json()
+    except ValueError:
+        update_data = None
+    if not isinstance(update_data, dict) or not isinstance(update_data.get("update_id"), int):
+        # Malformed updates are acknowledged, since Telegram would only resend them
+        logger.warning(f"Ignoring malformed Telegram update: {update_data}")
+        return {"status": "ok"}
+    logger.debug(f"Received Telegram update: {update_data}")
     
-    # Always return 200 OK to Telegram
+    # Hand the update to the workers and answer right away
+    if not update_queue.submit(update_data):
+        # Queue is full: Telegram retries non-2xx responses later
+        return JSONResponse({"status": "busy"}, status_code=503)
     return {"status": "ok"}
 
 
+@app.get("/metrics/updates")
+async def update_metrics():
+    """Queue depth and processing latency of incoming updates"""
+    return update_queue.metrics()
+
+
+@app.get("/metrics/ingest")
+async def ingestion_metrics():
+    """Latency and yield of the most recent refresh of each news source"""
+    return ingest_metrics
+
+
+@app.get("/metrics/category-cache")
+async def category_cache_metrics():
+    """Hit rate and staleness of the cached latest articles per category"""
+    return category_cache.metrics()
+
+
+@app.get("/metrics/llm-cache")
+async def llm_cache_metrics():
+    """LLM response cache hit rate and latency saved per call site"""
+    return cache_metrics()
+
+
+@app.get("/metrics/scheduler")
+async def scheduled_job_metrics():
+    """Run counts, durations and next run time of each scheduled job"""
+    return scheduler_metrics()
+
+
 
 if __name__ == "__main__":
     import uvicorn
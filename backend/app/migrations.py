@@ -0,0 +1,109 @@
+"""Schema migrations.
+
+`Base.metadata.create_all` creates tables that do not exist yet, with
+their indexes, but it never changes a table that already exists. Each
+migration below upgrades a database created by an older version. The
+migrations are idempotent, so on a fresh database (where create_all has
+already built everything) they only get recorded. Applied versions are
+stored in `schema_migrations`. Add new migrations at the end of
+MIGRATIONS with the next version number.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+from app.config import DEFAULT_DIGEST_TIME, DEFAULT_TIMEZONE
+from app.database import User, SchemaMigration
+from app.digest_buckets import utc_minute_of_day
+
+logger = logging.getLogger(__name__)
+
+
+def _add_columns(conn, table, columns):
+    """Add (name, DDL type) columns that the table does not have yet"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    for name, ddl_type in columns:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+
+
+def _create_indexes(conn, indexes):
+    for name, table, columns in indexes:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def add_dedup_columns(conn):
+    _add_columns(conn, "articles", [("simhash", "BIGINT"), ("story_cluster", "BIGINT")])
+    _create_indexes(conn, [("ix_articles_story_cluster", "articles", "story_cluster")])
+
+
+def add_delivery_bucket_columns(conn):
+    _add_columns(conn, "users", [("timezone", "VARCHAR(64)"), ("digest_minute_utc", "INTEGER")])
+    # Existing users keep their digest time, read in the default timezone
+    users = conn.execute(
+        text("SELECT id, digest_time FROM users WHERE digest_minute_utc IS NULL")
+    ).all()
+    for user_id, digest_time in users:
+        conn.execute(
+            User.__table__.update()
+            .where(User.__table__.c.id == user_id)
+            .values(
+                timezone=DEFAULT_TIMEZONE,
+                digest_minute_utc=utc_minute_of_day(digest_time or DEFAULT_DIGEST_TIME, DEFAULT_TIMEZONE),
+            )
+        )
+
+
+def add_hot_path_indexes(conn):
+    _create_indexes(conn, [
+        ("ix_articles_category_published", "articles", "category_id, published_at DESC"),
+        ("ix_conversations_user_timestamp", "conversations", "user_id, timestamp"),
+        ("ix_user_interactions_user_timestamp", "user_interactions", "user_id, timestamp"),
+        ("ix_users_digest_bucket", "users", "digest_minute_utc, is_active"),
+    ])
+
+
+def backfill_interaction_summary(conn):
+    # Rows written to the legacy user_interactions table before the event log
+    conn.execute(text(
+        "INSERT INTO interaction_summary (user_id, article_id, last_type, views, likes, dislikes, last_at) "
+        "SELECT user_id, article_id, interaction_type, "
+        "CASE WHEN interaction_type = 'view' THEN 1 ELSE 0 END, "
+        "CASE WHEN interaction_type = 'like' THEN 1 ELSE 0 END, "
+        "CASE WHEN interaction_type = 'dislike' THEN 1 ELSE 0 END, "
+        "timestamp FROM user_interactions "
+        "WHERE NOT EXISTS (SELECT 1 FROM interaction_summary s "
+        "WHERE s.user_id = user_interactions.user_id AND s.article_id = user_interactions.article_id)"
+    ))
+
+
+def add_conversation_tokens(conn):
+    # Older turns keep NULL and are counted when they are read
+    _add_columns(conn, "conversations", [("tokens", "INTEGER")])
+
+
+MIGRATIONS = [
+    (1, "add_dedup_columns", add_dedup_columns),
+    (2, "add_delivery_bucket_columns", add_delivery_bucket_columns),
+    (3, "add_hot_path_indexes", add_hot_path_indexes),
+    (4, "backfill_interaction_summary", backfill_interaction_summary),
+    (5, "add_conversation_tokens", add_conversation_tokens),
+]
+
+
+def _migrate(conn):
+    applied = {version for (version,) in conn.execute(text("SELECT version FROM schema_migrations"))}
+    for version, name, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"Applying migration {version}: {name}")
+        migration(conn)
+        conn.execute(
+            SchemaMigration.__table__.insert().values(version=version, name=name, applied_at=datetime.utcnow())
+        )
+
+
+async def run_migrations(engine):
+    """Apply pending migrations and record their versions in a single transaction"""
+    async with engine.begin() as conn:
+        await conn.run_sync(_migrate)
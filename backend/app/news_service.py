@@ -1,91 +1,470 @@
 import logging
 import asyncio
-from datetime import datetime, timedelta
+import io
+import multiprocessing
+import re
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin
+import httpx
 import newspaper
-from newspaper import Article
+from sqlalchemy import func
 from sqlalchemy.future import select
 
-from app.config import NEWS_SOURCES, NEWS_CATEGORIES
-from app.database import save_article, Article as ArticleModel, Category
+from app.config import (
+    INGEST_CONCURRENCY,
+    INGEST_MAX_PARALLEL_SOURCES,
+    INGEST_NLP_WORKERS,
+    INGEST_NLP_BATCH_SIZE,
+    INGEST_HTTP_TIMEOUT,
+    INGEST_USER_AGENT,
+    INGEST_MAX_SITEMAPS,
+    JOB_CLAIM_BATCH,
+)
+from app.database import async_session, read_session, save_articles, Article as ArticleModel, Category
+from app.article_parser import parse_batch
+from app.url_index import seen_urls, warm_seen_urls
+from app.http_cache import http_cache
+from app.sources import source_registry
+from app.categorizer import categorize_batch
+from app.dedup import story_index, warm_story_index, assign_story_clusters, to_unsigned
+from app.article_cache import category_cache
+from app.job_queue import enqueue_jobs, claim_jobs, complete_jobs, fail_jobs, hold_leases
 
 logger = logging.getLogger(__name__)
 
-async def fetch_news(session):
-    """Fetches news from configured sources"""
-    for source_url in NEWS_SOURCES:
+# newspaper3k parsing and NLP are CPU-bound and hold the GIL, so they run in worker processes
+_nlp_executor = None
+
+# Shared across all sources so that the global budget holds however many run at once
+_http_client = None
+_download_slots = asyncio.Semaphore(INGEST_CONCURRENCY)
+_source_slots = asyncio.Semaphore(INGEST_MAX_PARALLEL_SOURCES)
+_refresh_tasks = set()
+_synced_article_id = None  # newest article already in seen_urls and story_index
+
+# Latency and yield of the most recent refresh of each source, keyed by source name
+ingest_metrics = {}
+
+def get_nlp_executor():
+    """Return the process pool used for parsing, creating it on first use"""
+    global _nlp_executor
+    if _nlp_executor is None:
+        # Forking here would copy the event loop, aiosqlite and httpx threads and any locks
+        # they hold; forkserver (spawn where unavailable) starts clean workers instead
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        _nlp_executor = ProcessPoolExecutor(max_workers=INGEST_NLP_WORKERS, mp_context=context)
+    return _nlp_executor
+
+def get_http_client():
+    """Return the pooled HTTP client used for ingestion, creating it on first use"""
+    global _http_client
+    if _http_client is None:
+        limits = httpx.Limits(
+            max_connections=INGEST_CONCURRENCY,
+            max_keepalive_connections=INGEST_CONCURRENCY,
+        )
+        _http_client = httpx.AsyncClient(
+            limits=limits,
+            timeout=INGEST_HTTP_TIMEOUT,
+            follow_redirects=True,
+            headers={"User-Agent": INGEST_USER_AGENT},
+        )
+    return _http_client
+
+async def shutdown_ingestion():
+    """Cancel running refreshes and release the HTTP client and parsing processes"""
+    global _http_client, _nlp_executor
+    for task in list(_refresh_tasks):
+        task.cancel()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _nlp_executor is not None:
+        _nlp_executor.shutdown(wait=False, cancel_futures=True)
+        _nlp_executor = None
+
+async def fetch_news(sources=None):
+    """Fetches news from the given sources (all registered sources by default) in parallel"""
+    if sources is None:
+        sources = [source for source in source_registry.sources if not source.running]
+    await asyncio.gather(*(refresh_source(source) for source in sources))
+
+async def refresh_due_sources():
+    """Start a background refresh for every source whose interval has elapsed.
+
+    Sources refresh independently, so a slow outlet never delays the others.
+    Each refresh is a job in the shared queue, keyed by the source and its
+    current interval, so when several app instances run only one of them
+    fetches a given source per interval. An instance claims no more sources
+    than it has free source slots.
+    """
+    due = source_registry.due()
+    await enqueue_jobs("ingest", [
+        (f"ingest:{source.url}:{int(time.time() // (source.refresh_interval * 60))}", {"url": source.url})
+        for source in due
+    ])
+
+    # Only claim what this instance can start now; the rest stays for other instances
+    free_slots = INGEST_MAX_PARALLEL_SOURCES - sum(1 for source in source_registry.sources if source.running)
+    if free_slots <= 0:
+        return []
+
+    started = []
+    for job_id, payload in await claim_jobs("ingest", min(free_slots, JOB_CLAIM_BATCH)):
+        source = source_registry.get(payload["url"])
+        if source is None:
+            await fail_jobs([job_id], "unknown source")
+            continue
+        if source.running:
+            await complete_jobs([job_id])  # this instance is already refreshing it
+            continue
+        source.running = True  # claimed before the task starts so the next tick skips it
+        task = asyncio.create_task(_run_ingest_job(job_id, source))
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+        started.append(source)
+    return started
+
+async def _run_ingest_job(job_id, source):
+    async with hold_leases([job_id]):
+        metrics = await refresh_source(source)
+    if metrics["status"] == "ok":
+        await complete_jobs([job_id])
+    else:
+        await fail_jobs([job_id], metrics.get("error", metrics["status"]))
+
+async def refresh_source(source):
+    """Discover and ingest new articles for one source within its time budget"""
+    source.running = True
+    source.last_started = time.monotonic()
+    metrics = {"status": "ok", "discovered": 0, "new_urls": 0, "processed": 0, "saved": 0}
+    try:
+        async with _source_slots:
+            metrics["queued_seconds"] = round(time.monotonic() - source.last_started, 2)
+            await asyncio.wait_for(_refresh_source(source, metrics), timeout=source.timeout)
+    except asyncio.TimeoutError:
+        metrics["status"] = "timeout"
+        logger.error(f"Refreshing {source.name} exceeded {source.timeout}s")
+    except Exception as e:
+        metrics["status"] = "error"
+        metrics["error"] = str(e)
+        logger.error(f"Error fetching news from {source.url}: {e}")
+    finally:
+        seen_urls.flush()
+        source.running = False
+        metrics["total_seconds"] = round(time.monotonic() - source.last_started, 2)
+        metrics["finished_at"] = datetime.utcnow()
+        ingest_metrics[source.name] = metrics
+    return metrics
+
+async def sync_ingest_indexes(session):
+    """Load the seen-URL and story indexes, then add articles saved since the last sync.
+
+    Each source refresh runs on whichever instance claims it, so articles
+    saved by other instances have to be picked up here.
+    """
+    global _synced_article_id
+    latest_article_id = await session.scalar(select(func.max(ArticleModel.id)))
+    if not seen_urls.loaded:
+        await warm_seen_urls(session)
+    if not story_index.loaded:
+        await warm_story_index(session)
+    if _synced_article_id is not None and latest_article_id is not None:
+        result = await session.execute(
+            select(ArticleModel.url, ArticleModel.simhash, ArticleModel.story_cluster)
+            .where(ArticleModel.id > _synced_article_id, ArticleModel.id <= latest_article_id)
+        )
+        # Articles this instance saved itself are already in both indexes
+        rows = [row for row in result.all() if row.url and row.url not in seen_urls]
+        seen_urls.add(url for url, _, _ in rows)
+        for _, fingerprint, cluster in rows:
+            if fingerprint is not None:
+                story_index.add(to_unsigned(fingerprint), to_unsigned(cluster if cluster is not None else fingerprint))
+    _synced_article_id = latest_article_id
+
+async def _refresh_source(source, metrics):
+    async with read_session() as session:
+        await sync_ingest_indexes(session)
+
+    client = get_http_client()
+    started = time.monotonic()
+    validators = {}
+    entries, metrics["discovery_method"] = await discover_article_urls(client, source, validators)
+    metrics["discovery_seconds"] = round(time.monotonic() - started, 2)
+    article_urls = [url for url, _ in entries]
+    published_dates = {url: published_at for url, published_at in entries if published_at}
+
+    # Skip known articles before making any request for them
+    new_urls = seen_urls.filter_new(article_urls)
+    metrics["discovered"] = len(article_urls)
+    metrics["new_urls"] = len(new_urls)
+    logger.info(
+        f"---------->Found {len(article_urls)} articles from {source.url}, "
+        f"{len(new_urls)} not seen before"
+    )
+
+    async with async_session() as session:
+        await ingest_articles(
+            session, client, source, new_urls[:source.max_articles], metrics, published_dates
+        )
+
+    # Pages are only marked as seen once their articles are in, so a refresh that
+    # fails or leaves articles for the next run discovers them again
+    if len(new_urls) <= source.max_articles:
+        await http_cache.save(validators)
+
+    # Digests read from the cache, so refresh it as soon as new articles are committed
+    if metrics["saved"]:
+        await category_cache.refresh()
+
+async def discover_article_urls(client, source, validators=None):
+    """Discover article URLs for a source as (url, published_at) pairs, newest first.
+
+    RSS/Atom feeds and news sitemaps are preferred; newspaper's crawl of the
+    homepage and category pages is only used when the source has no feed.
+    Returns the entries and the discovery method used. HTTP cache validators
+    of the fetched pages are collected in `validators` for http_cache.save().
+    """
+    if not source.feeds:
+        await source.rate_limiter.acquire()
+        html, _, modified = await http_cache.get(client, source.url, validators)
+        if not modified:
+            logger.info(f"{source.url} not modified since last fetch, skipping discovery")
+            return [], "not_modified"
+        source.feeds = find_feed_links(source.url, html)
+        if not source.feeds:
+            crawled = await asyncio.to_thread(build_source, source.url, html)
+            return [(url, None) for url in crawled.article_urls()], "crawl"
+        logger.info(f"Discovered feeds for {source.name}: {source.feeds}")
+
+    entries = {}
+    pending = list(source.feeds)
+    while pending:
+        feed_url = pending.pop(0)
         try:
-            # Build newspaper source
-            source = newspaper.build(source_url, memoize_articles=False)
-            
-            total_articles = len(source.article_urls())
-            logger.info(f"---------->Found {total_articles} articles from {source_url}")
-            
-            # Get articles
-            for article_url in source.article_urls()[:300]:
-                try:
-                    # Parse article
-                    article = Article(article_url)
-                    article.download()
-                    article.parse()
-                    article.nlp()  # This extracts keywords, summary, etc.
-                    
-                    # Determine category
-                    category = await categorize_article(article)
-                    
-                    # Save to database
-                    await save_article_to_db(
-                        title=article.title,
-                        url=article_url,
-                        summary=article.summary,
-                        published_at=article.publish_date or datetime.utcnow(),
-                        source=source_url,
-                        category=category,
-                        session=session
-                    )
-                except Exception as e:
-                    logger.error(f"Error processing article {article_url}: {e}")
+            await source.rate_limiter.acquire()
+            _, body, modified = await http_cache.get(client, feed_url, validators)
         except Exception as e:
-            logger.error(f"Error fetching news from {source_url}: {e}")
+            logger.error(f"Error fetching feed {feed_url}: {e}")
+            continue
+        if not modified:
+            continue
+        feed_entries, child_sitemaps = await asyncio.to_thread(parse_feed, body)
+        for url, published_at in feed_entries:
+            entries.setdefault(url, published_at)
+        # Follow a sitemap index down to its newest child sitemaps
+        if feed_url in source.feeds:
+            pending.extend(child_sitemaps[:INGEST_MAX_SITEMAPS])
 
-async def categorize_article(article):
-    """Categorize an article into one of the predefined categories"""
-    # This is a simplified approach. In a production system, you would use
-    # a more sophisticated NLP-based categorization
-    
-    keywords = article.keywords
-    title_lower = article.title.lower()
-    text_lower = article.text.lower()
-    
-    # Simple keyword matching
-    for category in NEWS_CATEGORIES:
-        if category in keywords or category in title_lower or category in text_lower:
-            return category
-    
-    # Default category if no match
-    return "general"
+    ordered = sorted(entries.items(), key=lambda item: item[1] or datetime.min, reverse=True)
+    return ordered, "feed"
 
-async def save_article_to_db(title, url, summary, published_at, source, category, session):
-    """Save an article to the database"""
-    # Check if article already exists
-    result = await session.execute(
-        select(ArticleModel).where(ArticleModel.url == url)
+_FEED_LINK_RE = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+_FEED_TYPE_RE = re.compile(r"""type=["']application/(?:rss|atom)\+xml["']""", re.IGNORECASE)
+_HREF_RE = re.compile(r"""href=["']([^"']+)["']""", re.IGNORECASE)
+
+def find_feed_links(base_url, html):
+    """Find RSS/Atom feeds advertised with <link rel="alternate"> on a page"""
+    feeds = []
+    for tag in _FEED_LINK_RE.findall(html):
+        href = _HREF_RE.search(tag)
+        if href and _FEED_TYPE_RE.search(tag):
+            feed_url = urljoin(base_url, href.group(1))
+            if feed_url not in feeds:
+                feeds.append(feed_url)
+    return feeds
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def _parse_feed_date(value):
+    """Parse RFC 822 (RSS) or ISO 8601 (Atom, sitemaps) dates to naive UTC"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_feed(body):
+    """Stream-parse raw RSS, Atom or sitemap bytes (blocking).
+
+    The bytes are parsed as fetched, so the encoding named in the XML
+    declaration applies.
+
+    Returns (entries, child_sitemaps) where entries are (url, published_at)
+    pairs, newest first, and child_sitemaps are the locations listed by a
+    sitemap index, newest first.
+    """
+    entries = []
+    child_sitemaps = []
+    in_entry = False
+    url = published_at = None
+    try:
+        for event, element in ET.iterparse(io.BytesIO(body), events=("start", "end")):
+            name = _local_name(element.tag)
+            if event == "start":
+                if name in ("item", "entry", "url", "sitemap"):
+                    in_entry = True
+                    url = published_at = None
+                continue
+
+            if name in ("item", "entry", "url", "sitemap"):
+                if url:
+                    (child_sitemaps if name == "sitemap" else entries).append((url, published_at))
+                in_entry = False
+                element.clear()
+            elif not in_entry:
+                continue
+            elif name == "link":
+                # RSS: <link>url</link>; Atom: <link rel="alternate" href="url"/>
+                text = (element.text or "").strip()
+                if text:
+                    url = url or text
+                elif element.get("rel", "alternate") == "alternate" and element.get("href"):
+                    url = url or element.get("href")
+            elif name == "loc":
+                url = url or (element.text or "").strip()
+            elif name in ("pubDate", "published", "publication_date"):
+                published_at = _parse_feed_date(element.text) or published_at
+            elif name in ("updated", "lastmod", "date"):
+                published_at = published_at or _parse_feed_date(element.text)
+    except ET.ParseError as e:
+        logger.error(f"Error parsing feed: {e}")
+
+    def newest_first(items):
+        return sorted(items, key=lambda item: item[1] or datetime.min, reverse=True)
+
+    return newest_first(entries), [loc for loc, _ in newest_first(child_sitemaps)]
+
+def build_source(source_url, html):
+    """Run newspaper's source build on an already-downloaded homepage (blocking)"""
+    source = newspaper.Source(source_url, memoize_articles=False)
+    source.html = html
+    source.parse()
+    source.set_categories()
+    source.download_categories()
+    source.parse_categories()
+    source.set_feeds()
+    source.download_feeds()
+    source.generate_articles()
+    return source
+
+async def download_article(client, url):
+    """Download the raw HTML of an article.
+
+    Articles are not kept in the HTTP cache: a saved URL is never fetched
+    again, so only source and feed pages benefit from revalidation.
+    """
+    response = await client.get(url)
+    response.raise_for_status()
+    return response.text
+
+async def ingest_articles(session, client, source, article_urls, metrics, published_dates=None):
+    """Download articles concurrently, parse them in worker processes, then save them"""
+    published_dates = published_dates or {}
+    loop = asyncio.get_running_loop()
+    executor = get_nlp_executor()
+    source_limit = asyncio.Semaphore(source.max_concurrency)
+    started = time.monotonic()
+
+    async def download(article_url):
+        try:
+            async with source_limit:
+                # Wait for the source's rate limit before taking a global slot,
+                # so a slow outlet never holds slots that fast ones could use
+                await source.rate_limiter.acquire()
+                async with _download_slots:
+                    html = await download_article(client, article_url)
+            return (article_url, html) if html is not None else None
+        except Exception as e:
+            logger.error(f"Error downloading article {article_url}: {e}")
+            return None
+
+    # Ship downloaded pages to the process pool in batches while downloads continue
+    parse_jobs = []
+    batch = []
+    for next_download in asyncio.as_completed([download(url) for url in article_urls]):
+        item = await next_download
+        if item is not None:
+            batch.append(item)
+        if len(batch) >= INGEST_NLP_BATCH_SIZE:
+            parse_jobs.append(loop.run_in_executor(executor, parse_batch, batch))
+            batch = []
+    if batch:
+        parse_jobs.append(loop.run_in_executor(executor, parse_batch, batch))
+
+    for next_batch in asyncio.as_completed(parse_jobs):
+        try:
+            records = await next_batch
+        except Exception as e:
+            logger.error(f"Error parsing article batch from {source.url}: {e}")
+            continue
+
+        parsed = []
+        for record in records:
+            if "error" in record:
+                logger.error(f"Error processing article {record['url']}: {record['error']}")
+            else:
+                parsed.append(record)
+
+        rows = []
+        for record, ranked in zip(parsed, categorize_batch(parsed)):
+            rows.append({
+                "title": record["title"],
+                "url": record["url"],
+                "summary": record["summary"],
+                "published_at": (
+                    record["publish_date"] or published_dates.get(record["url"]) or datetime.utcnow()
+                ),
+                "source": source.url,
+                "category": ranked[0][0],
+            })
+
+        # Group wire copies of the same story under one cluster
+        assign_story_clusters(rows)
+
+        # One INSERT ... ON CONFLICT(url) DO NOTHING and one commit per batch
+        try:
+            inserted = await save_articles(session, rows)
+        except Exception as e:
+            logger.error(f"Error saving article batch from {source.url}: {e}")
+            continue
+        seen_urls.add(row["url"] for row in rows)
+        metrics["processed"] += len(rows)
+        metrics["saved"] += len(inserted)
+
+    elapsed = time.monotonic() - started
+    rate = metrics["processed"] / elapsed if elapsed > 0 else 0.0
+    metrics["ingest_seconds"] = round(elapsed, 2)
+    metrics["articles_per_sec"] = round(rate, 2)
+    logger.info(
+        f"Ingested {metrics['processed']}/{len(article_urls)} articles ({metrics['saved']} new) "
+        f"from {source.name} in {elapsed:.1f}s ({rate:.1f} articles/sec), "
+        f"HTTP cache: {http_cache.metrics()}"
+    )
+    return metrics["processed"]
+
+def recent_articles_query(category_id, limit):
+    """Newest articles of a category, served by ix_articles_category_published"""
+    return (
+        select(ArticleModel)
+        .where(ArticleModel.category_id == category_id)
+        .order_by(ArticleModel.published_at.desc())
+        .limit(limit)
     )
-    existing_article = result.scalars().first()
-    
-    if not existing_article:
-        # Save new article
-        await save_article(
-            session=session,
-            title=title,
-            url=url,
-            summary=summary,
-            published_at=published_at,
-            source=source,
-            category_name=category
-        )
-        logger.info(f"Saved new article: {title}")
-    else:
-        logger.debug(f"Article already exists: {title}")
 
 async def get_recent_articles_by_category(session, category, limit=10):
     """Get recent articles for a specific category"""
@@ -99,33 +478,40 @@ async def get_recent_articles_by_category(session, category, limit=10):
         return []
     
     # Get articles
-    result = await session.execute(
-        select(ArticleModel)
-        .where(ArticleModel.category_id == category_obj.id)
-        .order_by(ArticleModel.published_at.desc())
-        .limit(limit)
-    )
+    result = await session.execute(recent_articles_query(category_obj.id, limit))
     articles = result.scalars().all()
     logger.info(f"#######################Found {len(articles)} articles for user {articles}")
     return articles
 
 async def get_articles_for_digest(session, user_categories, limit_per_category=2):
-    """Get articles for a user's digest based on their preferences"""
+    """Get articles for a user's digest based on their preferences, one per story"""
     articles = []
+    seen_stories = set()
     
     # Get articles for each category
     for category in user_categories:
         logger.info(f"****************Getting articles for category: {category.name}")
-        category_articles = await get_recent_articles_by_category(
-            session, 
-            category.name, 
-            limit=limit_per_category
-        )
-        articles.extend(category_articles)
-        # logger.info(f"#######################Found {len(category_articles)} articles for user {category_articles.__dict__}")
+        # Over-fetch so that dropping near-duplicates still leaves enough articles
+        category_articles = await category_cache.get(category.name, limit_per_category * 3)
+        if category_articles is None:
+            category_articles = await get_recent_articles_by_category(
+                session, 
+                category.name, 
+                limit=limit_per_category * 3
+            )
+        picked = 0
+        for article in category_articles:
+            story = article.story_cluster if article.story_cluster is not None else f"url:{article.url}"
+            if story in seen_stories:
+                continue
+            seen_stories.add(story)
+            articles.append(article)
+            picked += 1
+            if picked == limit_per_category:
+                break
     
     # Sort by publication date
     articles.sort(key=lambda x: x.published_at, reverse=True)
     
     # Limit total number of articles
-    return articles[:limit_per_category * len(user_categories)]
\ No newline at end of file
+    return articles[:limit_per_category * len(user_categories)]
@@ -0,0 +1,134 @@
+"""Long-polling alternative to the webhook.
+
+Fetches updates with getUpdates and submits them to the same dispatcher
+the webhook uses, so updates are handled concurrently while each user's
+updates keep their order. Telegram drops every update below the offset
+passed to getUpdates, so the offset only advances past updates that have
+been processed: it is the oldest update still in flight. Polling does not
+wait for a whole batch, so one slow update (e.g. an LLM reply) holds back
+the offset but not the fetching of newer updates; updates fetched again
+because the offset stayed behind are skipped. The offset is written to a
+file, so a restart resumes where the previous run stopped, and an update
+that was interrupted is fetched again rather than lost.
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+
+from telegram.error import RetryAfter, TimedOut, NetworkError, Conflict
+
+from app.config import POLLING_BATCH_SIZE, POLLING_TIMEOUT, POLLING_OFFSET_PATH
+from app.telegram_handler import bot
+from app.update_queue import update_queue
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 30  # seconds between retries after repeated errors
+
+
+class PollingRunner:
+    """Feeds getUpdates batches into the update dispatcher"""
+
+    def __init__(self, batch_size=POLLING_BATCH_SIZE, timeout=POLLING_TIMEOUT, offset_path=POLLING_OFFSET_PATH):
+        self.batch_size = min(batch_size, 100)  # the Bot API maximum
+        self.timeout = timeout
+        self.offset_path = offset_path
+        self.offset = None
+        self._saved_offset = None
+        self._fetched_through = None  # newest update_id submitted to the dispatcher
+        self._in_flight = set()  # submitted update_ids not processed yet
+        self._progress = asyncio.Event()  # set whenever an update finishes
+        self._task = None
+        self.metrics = {"batches": 0, "updates": 0, "errors": 0}
+
+    def load_offset(self):
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path) as f:
+                content = f.read().strip()
+            self.offset = int(content) if content else None
+        self._saved_offset = self.offset
+
+    def save_offset(self):
+        # Written to a temporary file and renamed, so a crash never leaves a torn offset
+        tmp_path = f"{self.offset_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(self.offset))
+        os.replace(tmp_path, self.offset_path)
+        self._saved_offset = self.offset
+
+    def _update_done(self, update_id):
+        self._in_flight.discard(update_id)
+        self._progress.set()
+
+    def advance_offset(self):
+        """Move the offset up to the oldest update still in flight"""
+        if self._in_flight:
+            self.offset = min(self._in_flight)
+        elif self._fetched_through is not None:
+            self.offset = self._fetched_through + 1
+
+    async def start(self):
+        self.load_offset()
+        if self.offset is not None:
+            self._fetched_through = self.offset - 1
+        # getUpdates is refused while a webhook is set
+        await bot.delete_webhook()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Polling for updates from offset {self.offset}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        backoff = 1
+        while True:
+            try:
+                self.advance_offset()
+                if self.offset != self._saved_offset:
+                    self.save_offset()
+                self._progress.clear()
+                updates = await bot.get_updates(
+                    offset=self.offset,
+                    limit=self.batch_size,
+                    timeout=self.timeout,
+                )
+                backoff = 1
+
+                new_updates = [
+                    update for update in updates
+                    if self._fetched_through is None or update.update_id > self._fetched_through
+                ]
+                for update in new_updates:
+                    self._in_flight.add(update.update_id)
+                    # Wait for room rather than dropping updates when the dispatcher is full
+                    while not update_queue.submit(update.to_dict(), on_done=self._update_done):
+                        await asyncio.sleep(0.1)
+                    self._fetched_through = update.update_id
+                if new_updates:
+                    self.metrics["batches"] += 1
+                    self.metrics["updates"] += len(new_updates)
+                elif updates:
+                    # Only updates still in flight came back; wait for one to finish
+                    await self._progress.wait()
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                await asyncio.sleep(retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after)
+            except (TimedOut, NetworkError, Conflict) as e:
+                self.metrics["errors"] += 1
+                logger.warning(f"getUpdates failed, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+            except Exception as e:
+                # Anything else (e.g. Forbidden, or the offset file cannot be written)
+                # must not end polling for good
+                self.metrics["errors"] += 1
+                logger.error(f"Polling failed, retrying in {backoff}s: {e}", exc_info=True)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+polling_runner = PollingRunner()
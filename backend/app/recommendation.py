@@ -1,11 +1,23 @@
 
-from app.config import GEMINI_API_KEY, LLM_MODEL, ARTICLES_PER_DIGEST
-from app.database import User, Article, Conversation, user_interactions
+from app.config import (
+    GEMINI_API_KEY,
+    LLM_MODEL,
+    ARTICLES_PER_DIGEST,
+    DIGEST_COHORT_TTL,
+    DIGEST_COHORT_CACHE_SIZE,
+    DIGEST_PERSONAL_INTRO_LLM,
+    DIGEST_INTRO_TOKEN_BUDGET,
+    USER_CONTEXT_HISTORY_TURNS,
+)
+from app.database import User, user_interactions
 from app.news_service import get_articles_for_digest
+from app.article_cache import category_cache
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from litellm import acompletion
+from app.llm_client import cached_completion, MemoryCache
+from app.conversation_memory import load_memory, history_transcript
 from datetime import datetime, timedelta
+import asyncio
 import logging
 import openai
 import json
@@ -15,8 +27,13 @@ logger = logging.getLogger(__name__)
 # Configure OpenAI
 openai.api_key = GEMINI_API_KEY
 
-async def generate_digest_for_user(user_id, session):
-    """Generate a personalized news digest for a user"""
+async def generate_digest_for_user(user_id, session, metrics=None):
+    """Generate a personalized news digest for a user.
+
+    LLM usage is added to `metrics` (see new_digest_metrics) when given.
+    """
+    if metrics is None:
+        metrics = new_digest_metrics()
     # Get user
     result = await session.execute(
         select(User).where(User.id == user_id).options(selectinload(User.categories))
@@ -41,40 +58,20 @@ async def generate_digest_for_user(user_id, session):
     articles = await get_articles_for_digest(session, user_categories)
     
     
-    # Get user's conversation history for context
-    conversations = await get_recent_conversations(user_id, session, limit=5)
-    formatted_conversation = "\n".join(
-        f"User: {conv.message}\nAssistant: {conv.response}" for conv in conversations
-    )
+    # Get user's conversation summary and recent turns for context
+    memory = await load_memory(session, user_id, USER_CONTEXT_HISTORY_TURNS)
     
     # Generate personalized digest using LLM
-    digest = await generate_personalized_digest_with_llm(user, articles, formatted_conversation)
+    digest = await generate_personalized_digest_with_llm(user, articles, memory, metrics)
     
     return digest
 
-async def get_recent_conversations(user_id, session, limit=5):
-    """Get recent conversations for a user"""
-    result = await session.execute(
-        select(Conversation)
-        .where(Conversation.user_id == user_id)
-        .order_by(Conversation.timestamp.desc())
-        .limit(limit)
-    )
-    return result.scalars().all()
-
 async def generate_general_digest(session):
     """Generate a general digest for users with no preferences"""
     # Get recent articles from various categories
     articles = []
     for category in ["politics", "technology", "health", "entertainment"]:
-        result = await session.execute(
-            select(Article)
-            .join(Article.category)
-            .where(Category.name == category)
-            .order_by(Article.published_at.desc())
-            .limit(2)
-        )
-        articles.extend(result.scalars().all())
+        articles.extend(await category_cache.get(category, 2))
     
     # Sort by publication date
     articles.sort(key=lambda x: x.published_at, reverse=True)
@@ -82,49 +79,93 @@ async def generate_general_digest(session):
     # Generate digest
     return await format_digest(articles, personalized=False)
 
-async def generate_personalized_digest_with_llm(user, articles, conversation):
-    """Use LLM to generate a personalized news digest"""
+def _usage_tokens(response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0
+    return getattr(usage, "total_tokens", 0) or 0
+
+def new_digest_metrics():
+    """Counters for the LLM usage of one digest run"""
+    return {
+        "digests": 0,
+        "llm_calls": 0,
+        "cohorts": 0,
+        "cohort_hits": 0,
+        "tokens_used": 0,
+        "tokens_saved": 0,
+    }
+
+# Cohort key -> {"body", "tokens"}, expiring after DIGEST_COHORT_TTL; in-flight generations are futures
+_cohort_bodies = MemoryCache(DIGEST_COHORT_CACHE_SIZE)
+_cohort_in_flight = {}
+
+def cohort_key(categories, articles):
+    """Users with the same category set and candidate articles share a digest body"""
+    return (
+        tuple(sorted(category.name for category in categories)),
+        tuple(article.id for article in articles),
+    )
+
+async def get_cohort_digest_body(categories, articles, metrics):
+    """Article section of a digest, generated once per cohort and cached"""
+    key = cohort_key(categories, articles)
+    cached = await _cohort_bodies.get(key)
+    if cached:
+        metrics["cohort_hits"] += 1
+        metrics["tokens_saved"] += cached["tokens"]
+        return cached["body"]
+
+    # Users of the same cohort arriving concurrently wait for the first generation
+    in_flight = _cohort_in_flight.get(key)
+    if in_flight is not None:
+        body, tokens = await asyncio.shield(in_flight)
+        metrics["cohort_hits"] += 1
+        metrics["tokens_saved"] += tokens
+        return body
+
+    future = asyncio.get_running_loop().create_future()
+    _cohort_in_flight[key] = future
+    try:
+        body, tokens = await generate_digest_body_with_llm(categories, articles, metrics)
+        if tokens:
+            await _cohort_bodies.set(key, {"body": body, "tokens": tokens}, DIGEST_COHORT_TTL)
+        metrics["cohorts"] += 1
+        future.set_result((body, tokens))
+        return body
+    except BaseException as e:
+        # Also on cancellation, so users waiting on this cohort never hang;
+        # they get an ordinary error rather than a cancellation of their own
+        future.set_exception(e if isinstance(e, Exception) else RuntimeError("Digest body generation was cancelled"))
+        future.exception()  # mark retrieved when no other user is waiting
+        raise
+    finally:
+        del _cohort_in_flight[key]
+
+async def generate_digest_body_with_llm(categories, articles, metrics):
+    """Use the LLM to present the articles; returns (body, tokens used)"""
     # Prepare article data
     article_data = []
     for article in articles:
         article_data.append({
-            # "id": article.id,
             "title": article.title,
             "summary": article.summary,
             "category": article.category.name,
-            # "published_at": article.published_at.isoformat() if article.published_at else None,
             "url": article.url
         })
     
-    # Prepare conversation data
-    conversation_data = []
-    # for conv in conversations:
-    #     conversation_data.append({
-    #         "message": conv.message,
-    #         "response": conv.response,
-    #         "timestamp": conv.timestamp.isoformat()
-    #     })
-    
-    # article_json = json.dumps(article_data, indent=2).replace("_", "\\_").replace("*", "\\*").replace("[", "\\[").replace("]", "\\]")
-    
-    # conversation_json = json.dumps(conversation_data, indent=2).replace("_", "\\_").replace("*", "\\*").replace("[", "\\[").replace("]", "\\]")
-
-    
     prompt = f"""
-    Create a personalized news digest for a user with the following preferences:
-    - Categories: {", ".join([cat.name for cat in user.categories])}
-    
-    Recent conversations with the user:
-    {conversation}
+    Write the main section of a news digest for readers interested in:
+    - Categories: {", ".join([cat.name for cat in categories])}
     
     Articles to include in the digest:
     {json.dumps(article_data, indent=2)}
     
-    Create a conversational, engaging digest that:
-    1. Greets the user by name ({user.first_name})
-    2. Introduces the digest with a brief overview
-    3. Presents the articles in a conversational way, grouped by category or theme
-    4. **Present articles in a well-structured way**, grouping them by category. Use:
+    The greeting is added separately, so do not greet the reader or use any name.
+    Create a conversational, engaging digest section that:
+    1. Opens with a brief overview of today's stories
+    2. Presents the articles in a conversational way, grouped by category or theme
+    3. **Present articles in a well-structured way**, grouping them by category. Use:
         - Bold headers for each category
         - Bullet points for each article
         - A short, engaging summary for each article
@@ -137,13 +178,13 @@ async def generate_personalized_digest_with_llm(user, articles, conversation):
       Read more](URL)  
     
     """
-    # Format the digest in Markdown.
     
     logger.info(f"-------------------->LLM prompt: {prompt}")
     
     try:
         # Call the LLM API
-        response = await acompletion(
+        response, cached = await cached_completion(
+            "digest",
             model=LLM_MODEL,
             messages=[
                 {"role": "system", "content": "You are a helpful news assistant creating personalized digests."},
@@ -152,18 +193,62 @@ async def generate_personalized_digest_with_llm(user, articles, conversation):
             max_tokens=1000,
             temperature=0.7
         )
+        tokens = _usage_tokens(response)
+        if cached:
+            metrics["tokens_saved"] += tokens
+        else:
+            metrics["llm_calls"] += 1
+            metrics["tokens_used"] += tokens
         
         # Extract the digest text
-        digest_text = response.choices[0].message.content
-        logger.info(f"\n\n========Generated digest with LLM: {digest_text}")
+        body = response.choices[0].message.content
+        logger.info(f"\n\n========Generated digest with LLM: {body}")
         
-        return digest_text
+        return body, tokens
     except Exception as e:
         logger.error(f"Error generating digest with LLM: {e}")
-        # Fall back to simple formatting
-        return await format_digest(articles, personalized=True, user_name=user.first_name)
+        # Fall back to simple formatting (not cached, so the next user retries the LLM)
+        return await format_digest(articles, personalized=False, include_greeting=False), 0
+
+async def generate_personal_intro(user, memory, metrics):
+    """Short per-user greeting, referring to recent conversations when there are any"""
+    greeting = f"Good day, {user.first_name}!" if user.first_name else "Good day!"
+    if not (memory.turns or memory.summary) or not DIGEST_PERSONAL_INTRO_LLM:
+        return greeting
+
+    formatted_conversation = history_transcript(memory, DIGEST_INTRO_TOKEN_BUDGET)
+    try:
+        response, cached = await cached_completion(
+            "digest_intro",
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": "You write the opening lines of personalized news digests."},
+                {"role": "user", "content": (
+                    f"Greet {user.first_name} by name in one or two friendly sentences that "
+                    f"tie today's digest to what they recently talked about:\n{formatted_conversation}"
+                )}
+            ],
+            max_tokens=80,
+            temperature=0.7
+        )
+        if cached:
+            metrics["tokens_saved"] += _usage_tokens(response)
+        else:
+            metrics["llm_calls"] += 1
+            metrics["tokens_used"] += _usage_tokens(response)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Error generating digest intro with LLM: {e}")
+        return greeting
+
+async def generate_personalized_digest_with_llm(user, articles, memory, metrics):
+    """Personal intro plus the cohort's shared digest body"""
+    body = await get_cohort_digest_body(user.categories, articles, metrics)
+    intro = await generate_personal_intro(user, memory, metrics)
+    metrics["digests"] += 1
+    return f"{intro}\n\n{body}"
 
-async def format_digest(articles, personalized=True, user_name=None):
+async def format_digest(articles, personalized=True, user_name=None, include_greeting=True):
     """Format articles into a digest (fallback method)"""
     # Group articles by category
     categories = {}
@@ -177,10 +262,11 @@ async def format_digest(articles, personalized=True, user_name=None):
     digest = []
     
     # Add greeting
-    if personalized and user_name:
-        digest.append(f"# Good day, {user_name}!")
-    else:
-        digest.append("# Your Daily News Digest")
+    if include_greeting:
+        if personalized and user_name:
+            digest.append(f"# Good day, {user_name}!")
+        else:
+            digest.append("# Your Daily News Digest")
     
     digest.append("\nHere are today's top stories selected for you:\n")
     
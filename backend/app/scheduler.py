@@ -1,109 +1,133 @@
 
-from app.database import async_session, User
-from app.news_service import fetch_news
-from app.recommendation import generate_digest_for_user
-from app.telegram_handler import bot
-from app.config import NEWS_UPDATE_INTERVAL
-from telegram.constants import ParseMode
+from app.database import read_session, User, SchedulerRun
+from app.news_service import refresh_due_sources
+from app.delivery import deliver_digests, pregenerate_digests, refresh_digest_buckets
+from app.digest_buckets import to_utc, bucket_ranges, slot_for_bucket
 from sqlalchemy.future import select
-from datetime import datetime
+from sqlalchemy.orm import selectinload
+from datetime import datetime, timedelta
+from app.scheduling import Scheduler, IntervalTrigger, CronTrigger
+from app.article_cache import category_cache
+from app.job_queue import enqueue_jobs, claim_jobs, complete_jobs, fail_jobs, hold_leases, purge_finished_jobs
+from app.config import SCHEDULER_MAX_CONCURRENCY, DIGEST_CATCHUP_MINUTES, JOB_CLAIM_BATCH
 import logging
-import asyncio
-import schedule
-import time
-import threading
-import atexit
-
-scheduler_running = True  # Global flag to control the scheduler
 
 logger = logging.getLogger(__name__)
 
 
 
-async def update_news():
-    """Update news articles from sources, handling errors gracefully"""
-    logger.info("Updating news articles...")
-
+async def update_news(scheduled_for=None):
+    """Start refreshes for sources that are due, handling errors gracefully"""
     try:
-        async with async_session() as session:
-            await fetch_news(session)
-        logger.info("News update complete")
+        started = await refresh_due_sources()
+        if started:
+            logger.info(f"Updating news articles from {', '.join(source.name for source in started)}")
     except Exception as e:
         logger.error(f"Error updating news: {e}", exc_info=True)
 
 
-async def send_daily_digests():
-    """Send daily digests to users"""
-    logger.info("Sending daily digests...")
-    
-    # Get current time in HH:MM format
-    current_time = datetime.now().strftime("%H:%M")
+def due_users_query(first, last):
+    """Active users whose delivery bucket is within [first, last], served by ix_users_digest_bucket"""
+    return select(User.id, User.digest_minute_utc).where(
+        User.digest_minute_utc.between(first, last),
+        User.is_active == True
+    )
+
+
+async def send_daily_digests(scheduled_for=None):
+    """Send daily digests to users whose delivery bucket fell since the previous run.
+
+    Deliveries go through the shared job queue: every app instance enqueues
+    the same (user, slot) jobs, which dedupe by key, then all of them drain
+    the queue in leased batches, so each digest is sent by one worker and a
+    crashed worker's batch is picked up again once its lease expires.
+    """
+    # Window of UTC minutes to deliver: everything after the last completed run,
+    # so buckets missed while the app was down are caught up
+    end = to_utc(scheduled_for or datetime.now()).replace(second=0, microsecond=0)
+    async with read_session() as session:
+        last_run = await session.get(SchedulerRun, "send_daily_digests")
+        start = to_utc(last_run.last_run_at) if last_run and last_run.last_run_at else end - timedelta(minutes=1)
+        start = max(start, end - timedelta(minutes=DIGEST_CATCHUP_MINUTES))
+
+        # One indexed range scan on (digest_minute_utc, is_active) per range
+        jobs = []
+        for first, last in bucket_ranges(start, end):
+            result = await session.execute(due_users_query(first, last))
+            for user_id, bucket in result.all():
+                slot = slot_for_bucket(bucket, end)
+                jobs.append((f"digest:{user_id}:{slot.isoformat()}", {"user_id": user_id, "scheduled_for": slot.isoformat()}))
+    await enqueue_jobs("digest", jobs)
     
-    # Get users who should receive digests at this time
-    async with async_session() as session:
-        result = await session.execute(
-            select(User).where(
-                User.digest_time == current_time,
-                User.is_active == True
+    # Drain the queue, including retries and jobs abandoned by other workers
+    cache_checked = False
+    while True:
+        claimed = await claim_jobs("digest", JOB_CLAIM_BATCH)
+        if not claimed:
+            break
+        if not cache_checked:
+            # Articles may have been ingested by another instance
+            await category_cache.refresh_if_stale()
+            cache_checked = True
+        logger.info(f"Sending daily digests to {len(claimed)} users...")
+        
+        async with read_session() as session:
+            result = await session.execute(
+                select(User)
+                .where(User.id.in_([payload["user_id"] for _, payload in claimed]))
+                .options(selectinload(User.categories))
             )
-        )
-        users = result.scalars().all()
-    
-    # Send digest to each user
-    for user in users:
-        try:
-            # Generate digest
-            digest = await generate_digest_for_user(user.id, session)
-            
-            if digest:
-                # Send digest
-                await bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=digest,
-                    parse_mode=ParseMode.MARKDOWN_V2
-                )
-                logger.info(f"Sent digest to user {user.id}")
-            else:
-                logger.error(f"Failed to generate digest for user {user.id}")
-        except Exception as e:
-            logger.error(f"Error sending digest to user {user.id}: {e}")
+            users = {user.id: user for user in result.scalars().all()}
+        
+        deliveries, job_ids = [], {}
+        for job_id, payload in claimed:
+            user = users.get(payload["user_id"])
+            if user is None:
+                await complete_jobs([job_id])  # user was deleted since the job was queued
+                continue
+            deliveries.append((user, datetime.fromisoformat(payload["scheduled_for"])))
+            job_ids[user.id] = job_id
+        
+        # Send pre-generated digests (generating any missing ones) within Telegram's rate limits
+        failures = {}
+        async with hold_leases(list(job_ids.values())):
+            await deliver_digests(deliveries, failures)
+        
+        await complete_jobs([job_id for user_id, job_id in job_ids.items() if user_id not in failures])
+        for user_id, error in failures.items():
+            await fail_jobs([job_ids[user_id]], error)
     
     logger.info("Daily digest sending complete")
 
-def run_scheduler():
-    """Run the scheduler loop and allow stopping"""
-    while scheduler_running:
-        schedule.run_pending()
-        time.sleep(1)
+scheduler = None
 
-def start_scheduler():
+async def start_scheduler():
     """Set up and start the scheduler"""
+    global scheduler
+    scheduler = Scheduler(max_concurrency=SCHEDULER_MAX_CONCURRENCY)
     
-    loop = asyncio.get_event_loop()
+    # Each source has its own refresh interval; this only checks which ones are due
+    scheduler.add_job("update_news", IntervalTrigger(minutes=1), update_news, first_run=datetime.now())
     
-    schedule.every(NEWS_UPDATE_INTERVAL).minutes.do(
-        lambda: loop.create_task(update_news())
-    )
+    # Generate upcoming digests ahead of their delivery time
+    scheduler.add_job("pregenerate_digests", IntervalTrigger(minutes=1), pregenerate_digests)
     
-    for hour in range(24):
-        for minute in [0, 30]:
-            schedule_time = f"{hour:02d}:{minute:02d}"
-            schedule.every().day.at(schedule_time).do(
-                lambda: loop.create_task(send_daily_digests())
-            )
+    # Every minute is a delivery bucket; buckets missed during downtime are sent on start
+    scheduler.add_job("send_daily_digests", CronTrigger(minute="*"), send_daily_digests, catch_up=True)
     
-    loop.create_task(update_news())
-
-    global scheduler_thread
-    scheduler_thread = threading.Thread(target=run_scheduler)
-    scheduler_thread.daemon = True  # Allows FastAPI to exit cleanly
-    scheduler_thread.start()
+    # Keep UTC delivery buckets right across DST changes
+    scheduler.add_job("refresh_digest_buckets", CronTrigger(minute="5"), refresh_digest_buckets, first_run=datetime.now())
+    
+    # Drop finished queue jobs once they are past any catch-up window
+    scheduler.add_job("purge_finished_jobs", IntervalTrigger(minutes=60), purge_finished_jobs)
+    
+    await scheduler.start()
 
-# Ensure scheduler stops when FastAPI shuts down
-def stop_scheduler():
-    global scheduler_running
-    scheduler_running = False
-    if scheduler_thread.is_alive():
-        scheduler_thread.join()  # Ensure it stops cleanly
+def scheduler_metrics():
+    """Per-job run stats of the running scheduler"""
+    return scheduler.metrics() if scheduler is not None else {}
 
-atexit.register(stop_scheduler)
\ No newline at end of file
+async def stop_scheduler():
+    """Stop the scheduler if it was started"""
+    if scheduler is not None:
+        await scheduler.stop()
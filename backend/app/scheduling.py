@@ -0,0 +1,228 @@
+"""Asyncio scheduler engine.
+
+Jobs sit in a heap ordered by their next run time and the loop sleeps until
+the earliest one is due (or a job is added), instead of polling. Each job's
+last run is stored in the database so runs missed while the app was down
+are detected on start and, for jobs that ask for it, run once.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.future import select
+
+from app.database import async_session, SchedulerRun, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+
+class IntervalTrigger:
+    """Fire every fixed interval"""
+
+    def __init__(self, minutes=0, seconds=0):
+        self.interval = timedelta(minutes=minutes, seconds=seconds)
+
+    def next_after(self, moment):
+        return moment + self.interval
+
+    def __repr__(self):
+        return f"every {self.interval}"
+
+
+class CronTrigger:
+    """Fire on matching minutes/hours, e.g. CronTrigger(minute="0,30") or CronTrigger(minute="*/5", hour="8-18")"""
+
+    def __init__(self, minute="*", hour="*"):
+        self.spec = f"{minute} {hour}"
+        self.minutes = self._parse(minute, 60)
+        self.hours = self._parse(hour, 24)
+
+    @staticmethod
+    def _parse(field, size):
+        values = set()
+        for part in str(field).split(","):
+            step = 1
+            if "/" in part:
+                part, step = part.split("/")
+                step = int(step)
+            if part == "*":
+                start, end = 0, size - 1
+            elif "-" in part:
+                start, end = map(int, part.split("-"))
+            else:
+                start = end = int(part)
+            values.update(range(start, end + 1, step))
+        return values
+
+    def next_after(self, moment):
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(24 * 60):
+            if candidate.hour in self.hours and candidate.minute in self.minutes:
+                return candidate
+            candidate += timedelta(minutes=1)
+        raise ValueError(f"Cron spec '{self.spec}' never fires")
+
+    def __repr__(self):
+        return f"cron '{self.spec}'"
+
+
+class Job:
+    def __init__(self, name, trigger, func, catch_up=False):
+        self.name = name
+        self.trigger = trigger
+        self.func = func  # async callable taking the scheduled run time
+        self.catch_up = catch_up  # run once on start if a run was missed while down
+        self.next_run = None
+        self.running = False
+        self.metrics = {
+            "runs": 0,
+            "failures": 0,
+            "skipped": 0,  # still running when due, or missed while down
+            "last_run_at": None,
+            "last_duration": None,
+            "max_duration": 0.0,
+            "last_lag": None,  # seconds between the scheduled time and the actual start
+            "max_lag": 0.0,
+        }
+
+
+class Scheduler:
+    def __init__(self, max_concurrency=4):
+        self.jobs = {}
+        self._heap = []
+        self._counter = itertools.count()  # tie-breaker for jobs due at the same time
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._loop_task = None
+        self._running_tasks = set()
+
+    def add_job(self, name, trigger, func, catch_up=False, first_run=None):
+        job = Job(name, trigger, func, catch_up)
+        self.jobs[name] = job
+        self._schedule(job, first_run or trigger.next_after(datetime.now()))
+        return job
+
+    def _schedule(self, job, run_at):
+        job.next_run = run_at
+        heapq.heappush(self._heap, (run_at, next(self._counter), job.name))
+        self._wakeup.set()
+
+    async def start(self):
+        await self._detect_missed_runs()
+        self._loop_task = asyncio.create_task(self._run_loop())
+        logger.info(f"Scheduler started with jobs: {', '.join(f'{j.name} ({j.trigger})' for j in self.jobs.values())}")
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        for task in list(self._running_tasks):
+            task.cancel()
+
+    async def _detect_missed_runs(self):
+        async with async_session() as session:
+            result = await session.execute(select(SchedulerRun))
+            last_runs = {run.job_name: run.last_run_at for run in result.scalars().all()}
+
+        now = datetime.now()
+        for job in self.jobs.values():
+            last_run = last_runs.get(job.name)
+            if last_run is None:
+                continue
+            missed = job.trigger.next_after(last_run)
+            if missed >= now:
+                continue
+            logger.warning(f"Job {job.name} missed a run at {missed} while the app was down")
+            job.metrics["skipped"] += 1
+            if job.catch_up:
+                # Run once for the most recent missed time rather than replaying every one
+                latest = missed
+                while job.trigger.next_after(latest) < now:
+                    latest = job.trigger.next_after(latest)
+                self._schedule(job, latest)
+
+    async def _run_loop(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            run_at, _, name = self._heap[0]
+            delay = (run_at - datetime.now()).total_seconds()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue  # an earlier job may have been added meanwhile
+
+            heapq.heappop(self._heap)
+            job = self.jobs[name]
+            if run_at != job.next_run:
+                continue  # superseded entry, e.g. a catch-up run replaced it
+            self._dispatch(job, run_at)
+
+            # Next run strictly in the future; a loop stalled past several runs skips them
+            next_run = job.trigger.next_after(run_at)
+            now = datetime.now()
+            while next_run <= now:
+                job.metrics["skipped"] += 1
+                next_run = job.trigger.next_after(next_run)
+            self._schedule(job, next_run)
+
+    def _dispatch(self, job, run_at):
+        if job.running:
+            job.metrics["skipped"] += 1
+            logger.warning(f"Job {job.name} is still running, skipping the run due at {run_at}")
+            return
+        job.running = True
+        task = asyncio.create_task(self._run_job(job, run_at))
+        self._running_tasks.add(task)
+        task.add_done_callback(self._running_tasks.discard)
+
+    async def _run_job(self, job, run_at):
+        try:
+            async with self._slots:
+                lag = max(0.0, (datetime.now() - run_at).total_seconds())
+                started = time.monotonic()
+                try:
+                    await job.func(run_at)
+                except Exception as e:
+                    job.metrics["failures"] += 1
+                    logger.error(f"Job {job.name} failed: {e}", exc_info=True)
+                duration = time.monotonic() - started
+            job.metrics.update(
+                runs=job.metrics["runs"] + 1,
+                last_run_at=run_at,
+                last_duration=round(duration, 3),
+                max_duration=round(max(job.metrics["max_duration"], duration), 3),
+                last_lag=round(lag, 3),
+                max_lag=round(max(job.metrics["max_lag"], lag), 3),
+            )
+            await self._record_run(job.name, run_at)
+        finally:
+            job.running = False
+
+    async def _record_run(self, name, run_at):
+        try:
+            async with async_session() as session:
+                statement = dialect_insert(SchedulerRun.__table__).values(job_name=name, last_run_at=run_at)
+                await session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["job_name"],
+                        set_={"last_run_at": statement.excluded.last_run_at},
+                    )
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error recording run of job {name}: {e}")
+
+    def metrics(self):
+        return {
+            name: {**job.metrics, "next_run": job.next_run, "running": job.running}
+            for name, job in self.jobs.items()
+        }
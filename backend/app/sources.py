@@ -0,0 +1,73 @@
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from app.config import (
+    NEWS_SOURCES,
+    NEWS_SOURCES_FILE,
+    NEWS_UPDATE_INTERVAL,
+    NEWS_MAX_ARTICLES_PER_SOURCE,
+    INGEST_PER_HOST_LIMIT,
+    INGEST_SOURCE_REQUESTS_PER_SECOND,
+    INGEST_SOURCE_TIMEOUT,
+)
+from app.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class NewsSource:
+    """A news outlet with its own refresh schedule and politeness budget"""
+
+    url: str
+    name: str = ""
+    feeds: list = field(default_factory=list)  # RSS/Atom feeds or news sitemaps; detected if empty
+    refresh_interval: int = NEWS_UPDATE_INTERVAL  # minutes
+    max_concurrency: int = INGEST_PER_HOST_LIMIT  # concurrent article downloads
+    requests_per_second: float = INGEST_SOURCE_REQUESTS_PER_SECOND
+    max_articles: int = NEWS_MAX_ARTICLES_PER_SOURCE  # per refresh
+    timeout: float = INGEST_SOURCE_TIMEOUT  # seconds for a whole refresh
+
+    # Runtime state
+    running: bool = field(default=False, repr=False)
+    last_started: float = field(default=None, repr=False)  # time.monotonic()
+
+    def __post_init__(self):
+        if not self.name:
+            self.name = urlsplit(self.url).netloc
+        self.rate_limiter = TokenBucket(self.requests_per_second)
+
+    def is_due(self, now):
+        if self.running:
+            return False
+        return self.last_started is None or now - self.last_started >= self.refresh_interval * 60
+
+
+class SourceRegistry:
+    """The set of configured news sources"""
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+
+    def get(self, url):
+        return next((source for source in self.sources if source.url == url), None)
+
+    def due(self):
+        """Sources whose refresh interval has elapsed and that are not already running"""
+        now = time.monotonic()
+        return [source for source in self.sources if source.is_due(now)]
+
+
+def load_source_configs():
+    """Source settings from NEWS_SOURCES_FILE (a JSON list) or NEWS_SOURCES"""
+    configs = NEWS_SOURCES
+    if NEWS_SOURCES_FILE:
+        with open(NEWS_SOURCES_FILE) as f:
+            configs = json.load(f)
+    return [{"url": config} if isinstance(config, str) else config for config in configs]
+
+
+source_registry = SourceRegistry(NewsSource(**config) for config in load_source_configs())
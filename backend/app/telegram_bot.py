@@ -0,0 +1,81 @@
+"""The Telegram bot and rate-limited sending.
+
+Telegram allows roughly 30 messages/s per bot and about 1 message/s per
+chat. Every message the app sends (digests, chat replies, command replies)
+goes through send_message, so all of them share the same global and
+per-chat token buckets and back off together on a RetryAfter.
+"""
+import asyncio
+import logging
+import random
+from collections import OrderedDict
+from datetime import timedelta
+from telegram import Bot
+from telegram.error import RetryAfter, TimedOut, NetworkError, Forbidden, BadRequest
+from telegram.request import HTTPXRequest
+
+from app.config import (
+    TELEGRAM_TOKEN,
+    TELEGRAM_BASE_URL,
+    TELEGRAM_CONNECTION_POOL_SIZE,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_PER_CHAT_RATE,
+    TELEGRAM_SEND_RETRIES,
+)
+from app.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+bot = Bot(
+    token=TELEGRAM_TOKEN,
+    base_url=TELEGRAM_BASE_URL,
+    request=HTTPXRequest(connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE),
+    # Long polls get their own connection so they never hold up sends
+    get_updates_request=HTTPXRequest(connection_pool_size=1),
+)
+
+global_send_limit = TokenBucket(TELEGRAM_GLOBAL_RATE)
+_chat_send_limits = OrderedDict()  # chat_id -> TokenBucket, least recently used first
+
+
+def _chat_limit(chat_id):
+    limit = _chat_send_limits.get(chat_id)
+    if limit is None:
+        limit = _chat_send_limits[chat_id] = TokenBucket(TELEGRAM_PER_CHAT_RATE, capacity=1)
+    else:
+        _chat_send_limits.move_to_end(chat_id)
+    # A bucket that has refilled is no different from a new one, so idle chats are dropped
+    while len(_chat_send_limits) > 1:
+        oldest_chat_id, oldest = next(iter(_chat_send_limits.items()))
+        if oldest is limit or not oldest.is_full():
+            break
+        del _chat_send_limits[oldest_chat_id]
+    return limit
+
+
+def _seconds(retry_after):
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+async def send_message(chat_id, text, **kwargs):
+    """Send a message within Telegram's rate limits, retrying transient failures"""
+    for attempt in range(TELEGRAM_SEND_RETRIES + 1):
+        await _chat_limit(chat_id).acquire()
+        await global_send_limit.acquire()
+        try:
+            return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        except RetryAfter as e:
+            # Flood control applies to the whole bot, so every sender backs off
+            delay = _seconds(e.retry_after)
+            logger.warning(f"Telegram rate limit hit, pausing sends for {delay}s")
+            global_send_limit.pause(delay)
+        except (Forbidden, BadRequest):
+            # Blocked bot, deleted chat or malformed message: retrying will not help
+            raise
+        except (TimedOut, NetworkError) as e:
+            if attempt == TELEGRAM_SEND_RETRIES:
+                raise
+            delay = min(30.0, 2 ** attempt) * (0.5 + random.random())
+            logger.warning(f"Error sending to chat {chat_id} ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise RuntimeError(f"Giving up sending to chat {chat_id} after {TELEGRAM_SEND_RETRIES} retries")
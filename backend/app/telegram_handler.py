@@ -1,10 +1,13 @@
-from telegram import Bot, Update
+from telegram import Update
 from telegram.constants import ParseMode
-from app.config import TELEGRAM_TOKEN, NEWS_CATEGORIES
-from app.database import Category, User, get_user_by_telegram_id, create_user, user_interactions
-from datetime import datetime
+from app.config import NEWS_CATEGORIES
+from app.telegram_bot import bot, send_message
+from app.database import Category, User, create_user
+from app.interaction_log import interaction_log
+from app.user_context import load_user_context, user_contexts
 from app.conversation import process_message_with_llm, save_conversation
 from app.command_handler import convert_markdown_to_markdown_v2, handle_command
+from app.digest_buckets import utc_minute_of_day
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 import markdown
@@ -15,9 +18,6 @@ import re
 
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=TELEGRAM_TOKEN)
-
-
 async def process_telegram_update(update_data, session):
     # Convert the update data to an Update object
     update = Update.de_json(data=update_data, bot=bot)
@@ -33,9 +33,9 @@ async def handle_message(message, session):
     user_id = message.from_user.id
     text = message.text
     
-    # Get or create user
-    user = await get_user_by_telegram_id(session, user_id)
-    if not user:
+    # Get or create user (with the context a reply needs, usually from the cache)
+    context = await load_user_context(session, user_id)
+    if not context:
         user = await create_user(
             session,
             user_id,
@@ -46,24 +46,25 @@ async def handle_message(message, session):
         # Send welcome message
         await send_welcome_message(user_id)
         return
+    user = context.user
     
     # Check if this is a command
     if text and text.startswith('/'):
         command_response = await handle_command(message, session)
         if command_response:
-            await bot.send_message(**command_response)
+            await send_message(**command_response)
             return
     
     # Process message with LLM if not a command or command not recognized
     if text:
-        response_text = await process_message_with_llm(text, user, session)
+        response_text = await process_message_with_llm(text, user, session, context)
         
         # Save conversation
         await save_conversation(session, user.id, text, response_text)
         markdown_v2_text = convert_markdown_to_markdown_v2(response_text)
         
         # Send response
-        await bot.send_message(
+        await send_message(
             chat_id=user_id,
             text=markdown_v2_text,
             parse_mode=ParseMode.MARKDOWN_V2
@@ -78,10 +79,11 @@ async def handle_callback_query(callback_query, session):
     action = callback_data.get("action")
     
     # Get user
-    user = await get_user_by_telegram_id(session, user_id)
-    if not user:
+    context = await load_user_context(session, user_id)
+    if not context:
         await callback_query.answer("User not found. Please start a new conversation.")
         return
+    user = context.user
     
     # Handle different callback actions
     if action == "select_category":
@@ -120,10 +122,11 @@ async def send_welcome_message(user_id):
         "/categories - Set your news preferences\n"
         "/digest - Get your news digest now\n"
         "/time - Set your daily digest time\n"
+        "/timezone - Set your timezone, e.g. /timezone Europe/Berlin\n"
         "/help - Show all available commands"
     )
     
-    await bot.send_message(
+    await send_message(
         chat_id=user_id,
         text=welcome_text,
         parse_mode=ParseMode.MARKDOWN
@@ -157,21 +160,13 @@ async def update_user_category(session, user_id, category):
     if category_obj not in user.categories:
         user.categories.append(category_obj)
         await session.commit()
+        user_contexts.invalidate(user_id=user_id)
     
     return True
 
 async def save_article_feedback(session, user_id, article_id, feedback_type):
-    """Save user feedback on an article"""
-    # Insert into user_interactions
-    stmt = user_interactions.insert().values(
-        user_id=user_id,
-        article_id=article_id,
-        interaction_type=feedback_type,
-        timestamp=datetime.utcnow()
-    )
-    await session.execute(stmt)
-    await session.commit()
-    return True
+    """Save user feedback on an article (buffered; written in the next interaction log flush)"""
+    return interaction_log.record(user_id, article_id, feedback_type)
 
 async def update_digest_time(session, user_id, time):
     """Update user's preferred digest time"""
@@ -182,7 +177,9 @@ async def update_digest_time(session, user_id, time):
         return False
     
     user.digest_time = time
+    user.digest_minute_utc = utc_minute_of_day(time, user.timezone)
     await session.commit()
+    user_contexts.invalidate(user_id=user_id)
     return True
 
 
@@ -0,0 +1,158 @@
+"""In-process dispatcher for incoming Telegram updates.
+
+The webhook only validates and submits an update, so Telegram gets its
+200 right away and never retries a slow handler. Each user (keyed by
+telegram_id) has a FIFO of pending updates. A user's updates are handled
+one at a time and in arrival order, so a category tap never races a
+/digest. Different users are handled in parallel.
+
+Users are spread over shards by telegram_id. Each shard has a queue of
+users with work waiting and its own workers. A user is in that queue at
+most once. A worker handles the user's next update and then requeues the
+user if more updates are pending. A busy user therefore only ever
+occupies one worker, and other users are never stuck behind them.
+Redelivered updates are dropped by update_id.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+from app.config import UPDATE_QUEUE_SIZE, UPDATE_WORKERS, UPDATE_SHARDS, UPDATE_DEDUP_WINDOW
+from app.database import async_session
+from app.telegram_handler import process_telegram_update
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update_data):
+    """Telegram id of the user an update belongs to (the key for ordering)"""
+    for field in ("message", "edited_message", "callback_query"):
+        sender = (update_data.get(field) or {}).get("from")
+        if sender and "id" in sender:
+            return sender["id"]
+    return 0
+
+
+class _Shard:
+    """Per-user update FIFOs for a slice of users, and the users ready to run"""
+
+    def __init__(self):
+        self.chats = {}  # telegram_id -> deque of (update_data, enqueued_at, on_done)
+        self.ready = asyncio.Queue()
+        self.workers = []
+
+
+class UpdateQueue:
+    """Bounded, per-user ordered dispatch of raw updates to asyncio workers"""
+
+    def __init__(self, maxsize=UPDATE_QUEUE_SIZE, workers=UPDATE_WORKERS, shards=UPDATE_SHARDS,
+                 dedup_window=UPDATE_DEDUP_WINDOW):
+        self.maxsize = maxsize
+        self.worker_count = max(workers, shards)
+        self.shard_count = shards
+        self.dedup_window = dedup_window
+        self._shards = []
+        self._pending = 0  # updates queued or running, across all shards
+        self._idle = asyncio.Event()
+        self._recent_ids = OrderedDict()  # update_ids seen lately, oldest first
+        self._stats = {"received": 0, "duplicates": 0, "rejected": 0, "processed": 0, "failed": 0}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def start(self):
+        self._shards = [_Shard() for _ in range(self.shard_count)]
+        self._idle.set()
+        for i in range(self.worker_count):
+            shard = self._shards[i % self.shard_count]
+            shard.workers.append(asyncio.create_task(self._worker(shard)))
+
+    async def stop(self, timeout=10):
+        """Finish pending updates (up to `timeout` seconds), then stop the workers"""
+        if not self._shards:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._pending} unprocessed updates on shutdown")
+        workers = [worker for shard in self._shards for worker in shard.workers]
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._shards = []
+
+    def submit(self, update_data, on_done=None):
+        """Queue an update; returns False if it must be retried later because the queue is full.
+
+        `on_done` is called with the update_id once the update has been handled
+        (successfully or not), or right away if it is a duplicate.
+        """
+        update_id = update_data["update_id"]
+        self._stats["received"] += 1
+        if update_id in self._recent_ids:
+            self._stats["duplicates"] += 1
+            if on_done is not None:
+                on_done(update_id)
+            return True
+        if self._pending >= self.maxsize:
+            self._stats["rejected"] += 1
+            return False
+
+        self._recent_ids[update_id] = None
+        if len(self._recent_ids) > self.dedup_window:
+            self._recent_ids.popitem(last=False)
+
+        key = chat_key(update_data)
+        shard = self._shards[hash(key) % self.shard_count]
+        pending = shard.chats.get(key)
+        if pending is None:
+            # No update of this user is queued or running, so it becomes ready
+            pending = shard.chats[key] = deque()
+            shard.ready.put_nowait(key)
+        pending.append((update_data, time.monotonic(), on_done))
+        self._pending += 1
+        self._idle.clear()
+        return True
+
+    async def _worker(self, shard):
+        while True:
+            key = await shard.ready.get()
+            pending = shard.chats[key]
+            update_data, enqueued_at, on_done = pending[0]
+            try:
+                async with async_session() as session:
+                    await process_telegram_update(update_data, session)
+                self._stats["processed"] += 1
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"Error processing update {update_data.get('update_id')}: {e}", exc_info=True)
+            finally:
+                self._record_latency(time.monotonic() - enqueued_at)
+                pending.popleft()
+                if pending:
+                    shard.ready.put_nowait(key)
+                else:
+                    del shard.chats[key]
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.set()
+                if on_done is not None:
+                    on_done(update_data["update_id"])
+
+    def _record_latency(self, seconds):
+        self._latency_total += seconds
+        self._latency_max = max(self._latency_max, seconds)
+
+    def metrics(self):
+        handled = self._stats["processed"] + self._stats["failed"]
+        return {
+            **self._stats,
+            "queue_depth": self._pending,
+            "busy_chats": sum(len(shard.chats) for shard in self._shards),
+            "shard_depths": [sum(len(chat) for chat in shard.chats.values()) for shard in self._shards],
+            "avg_latency_seconds": round(self._latency_total / handled, 3) if handled else 0.0,
+            "max_latency_seconds": round(self._latency_max, 3),
+        }
+
+
+update_queue = UpdateQueue()
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+import os
+from urllib.parse import urldefrag
+from sqlalchemy.future import select
+
+from app.config import SEEN_URL_INDEX_PATH
+from app.database import Article
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 8  # bytes per URL fingerprint; collisions are negligible below billions of URLs
+
+
+class SeenUrlIndex:
+    """Set of URL fingerprints persisted to an append-only file on disk"""
+
+    def __init__(self, path):
+        self.path = path
+        self._digests = set()
+        self._pending = []
+        self.loaded = False
+
+    @staticmethod
+    def fingerprint(url):
+        url, _ = urldefrag(url.strip())
+        return hashlib.blake2b(url.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+    def __contains__(self, url):
+        return self.fingerprint(url) in self._digests
+
+    def __len__(self):
+        return len(self._digests)
+
+    def add(self, urls):
+        """Mark URLs as seen; new fingerprints are written on the next flush"""
+        for url in urls:
+            digest = self.fingerprint(url)
+            if digest not in self._digests:
+                self._digests.add(digest)
+                self._pending.append(digest)
+
+    def filter_new(self, urls):
+        """Return the URLs that have not been seen, preserving order"""
+        new_urls = []
+        batch = set()
+        for url in urls:
+            digest = self.fingerprint(url)
+            if digest not in self._digests and digest not in batch:
+                batch.add(digest)
+                new_urls.append(url)
+        return new_urls
+
+    def load(self):
+        """Load fingerprints from disk"""
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % DIGEST_SIZE  # ignore a torn trailing write
+            self._digests.update(data[i:i + DIGEST_SIZE] for i in range(0, usable, DIGEST_SIZE))
+        self.loaded = True
+
+    def flush(self):
+        """Append fingerprints added since the last flush to disk"""
+        if not self._pending:
+            return
+        with open(self.path, "ab") as f:
+            f.write(b"".join(self._pending))
+        self._pending = []
+
+    async def warm_from_db(self, session):
+        """Add every stored article URL, so the index survives a lost or stale file"""
+        result = await session.stream(select(Article.url))
+        async for partition in result.partitions(10000):
+            self.add(url for (url,) in partition if url)
+        self.flush()
+
+
+seen_urls = SeenUrlIndex(SEEN_URL_INDEX_PATH)
+
+
+async def warm_seen_urls(session):
+    """Load the seen-URL index from disk and the articles table"""
+    seen_urls.load()
+    await seen_urls.warm_from_db(session)
+    logger.info(f"Seen-URL index warmed with {len(seen_urls)} URLs")
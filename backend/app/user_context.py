@@ -0,0 +1,139 @@
+"""Per-user context for conversational replies, cached by telegram_id.
+
+A reply needs the user, their categories, the articles they interacted
+with recently and their last conversation turns. On a cache miss this is
+loaded in one session (the user with categories in one joined query, then
+the other two). The snapshot is then reused across the handler and later
+messages. Writers keep it correct: save_conversation appends the new turn
+to the snapshot, summary updates replace the turns they cover, and
+preference, schedule or interaction writes drop it.
+Snapshots also expire after USER_CONTEXT_TTL seconds, which bounds
+staleness from writes made by other app instances.
+"""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
+
+from app.config import USER_CONTEXT_CACHE_SIZE, USER_CONTEXT_TTL, USER_CONTEXT_HISTORY_TURNS
+from app.database import User, Article, InteractionSummary
+from app.conversation_memory import Memory, load_memory
+
+logger = logging.getLogger(__name__)
+
+RECENT_ARTICLES_LIMIT = 3
+
+
+@dataclass
+class UserContext:
+    """Snapshot of what a conversational reply needs to know about a user"""
+    user: User  # detached, with categories loaded
+    recent_articles: List[str] = field(default_factory=list)  # titles, most recent first
+    memory: Memory = field(default_factory=Memory)  # conversation summary and recent turns
+
+    @property
+    def preferences(self):
+        return [category.name for category in self.user.categories]
+
+
+class UserContextCache:
+    """LRU of UserContext snapshots keyed by telegram_id, with a TTL"""
+
+    def __init__(self, max_entries=USER_CONTEXT_CACHE_SIZE, ttl=USER_CONTEXT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # telegram_id -> (expires_at, UserContext)
+        self._telegram_ids = {}  # user id -> telegram_id, for writers that only know the user id
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id):
+        entry = self._entries.get(telegram_id)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, context):
+        telegram_id = context.user.telegram_id
+        self._entries[telegram_id] = (time.monotonic() + self.ttl, context)
+        self._entries.move_to_end(telegram_id)
+        self._telegram_ids[context.user.id] = telegram_id
+        while len(self._entries) > self.max_entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._telegram_ids.pop(evicted.user.id, None)
+
+    def invalidate(self, telegram_id=None, user_id=None):
+        """Drop the snapshot of a user, identified by either id"""
+        if telegram_id is None:
+            telegram_id = self._telegram_ids.get(user_id)
+        entry = self._entries.pop(telegram_id, None)
+        if entry is not None:
+            self._telegram_ids.pop(entry[1].user.id, None)
+
+    def _cached(self, user_id):
+        entry = self._entries.get(self._telegram_ids.get(user_id))
+        return entry[1] if entry is not None else None
+
+    def record_turn(self, user_id, turn):
+        """Append a saved conversation turn to the user's snapshot, if cached"""
+        context = self._cached(user_id)
+        if context is not None:
+            context.memory.add_turn(turn, USER_CONTEXT_HISTORY_TURNS)
+
+    def apply_summary(self, user_id, summary):
+        """Swap in a new conversation summary for the user's snapshot, if cached"""
+        context = self._cached(user_id)
+        if context is not None:
+            context.memory.apply_summary(summary)
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+user_contexts = UserContextCache()
+
+
+def recent_article_titles_query(user_id, limit=RECENT_ARTICLES_LIMIT):
+    """Titles of the articles a user interacted with most recently, served by ix_interaction_summary_user_last"""
+    return (
+        select(Article.title)
+        .join(InteractionSummary, InteractionSummary.article_id == Article.id)
+        .where(InteractionSummary.user_id == user_id)
+        .order_by(InteractionSummary.last_at.desc())
+        .limit(limit)
+    )
+
+
+async def load_user_context(session, telegram_id):
+    """Return the UserContext for a telegram_id, or None for unknown users"""
+    context = user_contexts.get(telegram_id)
+    if context is not None:
+        return context
+
+    result = await session.execute(
+        select(User).options(joinedload(User.categories)).where(User.telegram_id == telegram_id)
+    )
+    user = result.unique().scalars().first()
+    if user is None:
+        return None
+
+    result = await session.execute(recent_article_titles_query(user.id))
+    recent_articles = list(result.scalars().all())
+
+    memory = await load_memory(session, user.id, USER_CONTEXT_HISTORY_TURNS)
+
+    context = UserContext(user=user, recent_articles=recent_articles, memory=memory)
+    user_contexts.put(context)
+    return context
@@ -0,0 +1,14 @@
+"""Test settings, applied before any test module imports the app.
+
+app.config reads the environment at import time, so the database and bot
+token are set here: tests get a throwaway SQLite file, and the bot (created
+on import, never used) gets a well-formed dummy token.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:test")
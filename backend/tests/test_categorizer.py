@@ -0,0 +1,51 @@
+"""The weighted keyword categorizer against the substring scan it replaced.
+
+fixtures/labeled_articles.json holds hand-labeled articles, six per
+category, shaped like the records article_parser produces.
+"""
+import json
+import os
+import time
+
+from app.categorizer import categorize_batch
+from app.config import NEWS_CATEGORIES
+
+with open(os.path.join(os.path.dirname(__file__), "fixtures", "labeled_articles.json")) as f:
+    ARTICLES = json.load(f)
+
+
+def substring_category(article):
+    """The previous rule: the first category whose name appears in the keywords, title or text"""
+    title = article["title"].lower()
+    text = article["text"].lower()
+    for category in NEWS_CATEGORIES:
+        if category in article["keywords"] or category in title or category in text:
+            return category
+    return "general"
+
+
+def _accuracy(predicted):
+    return sum(category == article["label"] for category, article in zip(predicted, ARTICLES)) / len(ARTICLES)
+
+
+def test_fixture_covers_every_category():
+    assert {article["label"] for article in ARTICLES} == set(NEWS_CATEGORIES)
+
+
+def test_more_accurate_than_substring_scan():
+    categorizer = _accuracy([ranked[0][0] for ranked in categorize_batch(ARTICLES)])
+    substring = _accuracy([substring_category(article) for article in ARTICLES])
+
+    assert categorizer >= 0.9
+    assert categorizer > substring
+
+
+def test_throughput():
+    # Parsing an article takes tens of milliseconds, so categorizing must stay far below that.
+    # The substring scan is faster still in raw CPU; scoring every token is the price of the accuracy.
+    articles = ARTICLES * 50
+    started = time.perf_counter()
+    categorize_batch(articles)
+    per_article = (time.perf_counter() - started) / len(articles)
+
+    assert per_article < 0.001
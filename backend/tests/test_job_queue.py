@@ -0,0 +1,130 @@
+"""The job queue shared by several app processes.
+
+Each worker is a separate spawned process with its own engine and
+WORKER_ID, all pointed at one SQLite file, the way several app instances
+share a database. App modules are imported inside the workers only, after
+DATABASE_URL is set, since app.config reads it at import time.
+"""
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+WORKERS = 4
+JOBS = 200
+
+
+def _in_worker(database_url, coroutine_function, *args):
+    os.environ["DATABASE_URL"] = database_url
+    import asyncio
+
+    async def run():
+        from app.database import dispose_engines
+        try:
+            return await coroutine_function(*args)
+        finally:
+            await dispose_engines()
+
+    return asyncio.run(run())
+
+
+async def _setup(count):
+    from app.database import init_db
+    from app.job_queue import enqueue_jobs
+    await init_db()
+    await enqueue_jobs("test", [(f"test:{n}", {"n": n}) for n in range(count)])
+
+
+async def _enqueue_again(count):
+    from app.job_queue import enqueue_jobs
+    await enqueue_jobs("test", [(f"test:{n}", {"n": n}) for n in range(count)])
+
+
+async def _drain(batch_size):
+    import asyncio
+    from app.job_queue import claim_jobs, complete_jobs
+    done = []
+    while True:
+        claimed = await claim_jobs("test", batch_size)
+        if not claimed:
+            return done
+        await asyncio.sleep(0.01)  # let the other workers interleave
+        done.extend(payload["n"] for _, payload in claimed)
+        await complete_jobs([job_id for job_id, _ in claimed])
+
+
+async def _claim(limit, lease_seconds, delay=0):
+    import asyncio
+    from app.job_queue import claim_jobs
+    await asyncio.sleep(delay)
+    return [payload["n"] for _, payload in await claim_jobs("test", limit, lease_seconds)]
+
+
+async def _claim_and_hold(limit, lease_seconds, hold_seconds):
+    import asyncio
+    from app.job_queue import claim_jobs, complete_jobs, hold_leases
+    claimed = await claim_jobs("test", limit, lease_seconds)
+    job_ids = [job_id for job_id, _ in claimed]
+    async with hold_leases(job_ids, lease_seconds):
+        await asyncio.sleep(hold_seconds)
+    await complete_jobs(job_ids)
+    return [payload["n"] for _, payload in claimed]
+
+
+async def _statuses():
+    from sqlalchemy import func
+    from sqlalchemy.future import select
+    from app.database import async_session, QueueJob
+    async with async_session() as session:
+        result = await session.execute(select(QueueJob.status, func.count()).group_by(QueueJob.status))
+        return dict(result.all())
+
+
+@pytest.fixture
+def queue(tmp_path):
+    database_url = f"sqlite+aiosqlite:///{tmp_path / 'queue.db'}"
+    executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+    def run(coroutine_function, *args):
+        return executor.submit(_in_worker, database_url, coroutine_function, *args)
+
+    run(_setup, JOBS).result()
+    yield run
+    executor.shutdown()
+
+
+def test_each_job_is_claimed_once(queue):
+    # Every instance enqueues the same keys; duplicates are ignored
+    for future in [queue(_enqueue_again, JOBS) for _ in range(WORKERS)]:
+        future.result()
+
+    drained = [queue(_drain, 5) for _ in range(WORKERS)]
+    done = Counter(n for future in drained for n in future.result())
+
+    assert sorted(done) == list(range(JOBS))
+    assert max(done.values()) == 1
+    assert queue(_statuses).result() == {"done": JOBS}
+
+
+def test_expired_lease_is_claimed_again(queue):
+    first = queue(_claim, 10, 1).result()
+    assert len(first) == 10
+
+    # The first worker "died" without completing; its jobs are leased until they expire
+    assert not set(queue(_claim, JOBS, 1).result()) & set(first)
+    time.sleep(1.5)
+    assert set(first) <= set(queue(_claim, JOBS, 60).result())
+
+
+def test_held_lease_is_not_taken_over(queue):
+    holder = queue(_claim_and_hold, 10, 1, 3)
+    # Claim after the original lease would have expired, while the holder keeps renewing it
+    other = queue(_claim, JOBS, 60, 2)
+
+    held = holder.result()
+    assert len(held) == 10
+    assert not set(other.result()) & set(held)
+    assert queue(_statuses).result() == {"done": 10, "leased": JOBS - 10}
@@ -0,0 +1,134 @@
+"""EXPLAIN QUERY PLAN checks for the hot queries.
+
+Seeds a SQLite database built by init_db() and asserts that each hot query,
+built by the same function the app uses, is answered from its index,
+without a full scan or a temporary B-tree for the ORDER BY. A failure here
+means an index or a query drifted apart.
+
+Tables are seeded with QUERY_PLAN_SEED_ROWS rows (20,000 by default, so the
+suite stays fast). The plans are the same at 1,000,000 rows; set
+QUERY_PLAN_SEED_ROWS=1000000 to check that at production scale.
+"""
+import asyncio
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import make_url
+
+from app.config import DATABASE_URL
+from app.database import init_db, dispose_engines
+from app.news_service import recent_articles_query
+from app.conversation_memory import newest_turns_query
+from app.user_context import recent_article_titles_query
+from app.scheduler import due_users_query
+from app.delivery import pregeneration_query
+
+ROWS = int(os.getenv("QUERY_PLAN_SEED_ROWS", 20000))
+USERS = max(ROWS // 10, 100)
+CATEGORIES = 20
+NOW = datetime(2025, 1, 1)
+
+
+def _seed(conn):
+    rng = random.Random(0)
+    conn.executemany(
+        "INSERT INTO categories (id, name) VALUES (?, ?)",
+        [(i, f"category-{i}") for i in range(1, CATEGORIES + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO users (id, telegram_id, first_name, digest_minute_utc, is_active) VALUES (?, ?, ?, ?, ?)",
+        ((i, 100000 + i, f"user-{i}", rng.randrange(1440), rng.random() < 0.9) for i in range(1, USERS + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO articles (id, title, url, summary, published_at, source, category_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            (i, f"title {i}", f"https://example.com/{i}", "summary", str(NOW - timedelta(minutes=i)), "example",
+             rng.randrange(1, CATEGORIES + 1))
+            for i in range(1, ROWS + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO conversations (id, user_id, message, response, tokens, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (i, rng.randrange(1, USERS + 1), "message", "response", 10, str(NOW - timedelta(minutes=i)))
+            for i in range(1, ROWS + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO interaction_summary (user_id, article_id, last_type, views, likes, dislikes, last_at) "
+        "VALUES (?, ?, 'view', 1, 0, 0, ?)",
+        (
+            (rng.randrange(1, USERS + 1), article_id, str(NOW - timedelta(minutes=article_id)))
+            for article_id in (rng.randrange(1, ROWS + 1) for _ in range(ROWS))
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO digests (user_id, scheduled_for, text) VALUES (?, ?, 'digest')",
+        ((user_id, str(NOW + timedelta(minutes=user_id % 60))) for user_id in range(1, USERS + 1, 3)),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+@pytest.fixture(scope="module")
+def db():
+    async def create():
+        await init_db()
+        await dispose_engines()
+
+    asyncio.run(create())
+    conn = sqlite3.connect(make_url(DATABASE_URL).database)  # the test database from conftest
+    _seed(conn)
+    yield conn
+    conn.close()
+
+
+def _plan(conn, statement):
+    compiled = statement.compile(dialect=sqlite.dialect())
+    params = compiled.construct_params()
+    values = [
+        str(value) if isinstance(value, datetime) else value
+        for value in (params[name] for name in compiled.positiontup)
+    ]
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {compiled}", values)]
+
+
+def _assert_uses_index(plan, table, index):
+    assert any(
+        step.startswith(f"SEARCH {table} USING") and f"INDEX {index}" in step for step in plan
+    ), plan
+    assert not any(step.startswith("SCAN ") for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_recent_articles_by_category(db):
+    # news_service.get_recent_articles_by_category
+    _assert_uses_index(_plan(db, recent_articles_query(3, 10)), "articles", "ix_articles_category_published")
+
+
+def test_conversation_memory(db):
+    # conversation_memory.load_memory
+    _assert_uses_index(_plan(db, newest_turns_query(42, 100, 12)), "conversations", "ix_conversations_user_timestamp")
+
+
+def test_recent_interactions(db):
+    # user_context.load_user_context
+    plan = _plan(db, recent_article_titles_query(42))
+    _assert_uses_index(plan, "interaction_summary", "ix_interaction_summary_user_last")
+
+
+def test_due_digest_users(db):
+    # scheduler.send_daily_digests
+    _assert_uses_index(_plan(db, due_users_query(480, 480)), "users", "ix_users_digest_bucket")
+
+
+def test_digests_to_pregenerate(db):
+    # delivery.pregenerate_digests
+    plan = _plan(db, pregeneration_query(480, 489, NOW))
+    _assert_uses_index(plan, "users", "ix_users_digest_bucket")
+    _assert_uses_index(plan, "digests", "ix_digests_scheduled_for")
@@ -0,0 +1,114 @@
+"""Bulk article writes: ON CONFLICT behavior and the speedup over per-article saves.
+
+The benchmark writes SAVE_BENCHMARK_ARTICLES articles (10,000 by default)
+through save_articles and through the per-article path it replaced
+(a SELECT by url, then save_article with its own commit, per article).
+Run with -s to see the timings.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from app.database import async_session, dispose_engines, init_db, save_article, save_articles, Article
+
+BENCHMARK_ARTICLES = int(os.getenv("SAVE_BENCHMARK_ARTICLES", 10000))
+
+
+def _run(coroutine):
+    async def run():
+        try:
+            await init_db()
+            return await coroutine
+        finally:
+            await dispose_engines()
+
+    return asyncio.run(run())
+
+
+def _articles(prefix, numbers, category="technology"):
+    return [
+        {
+            "title": f"{prefix} title {n}",
+            "url": f"https://{prefix}.example.com/{n}",
+            "summary": "summary",
+            "published_at": datetime(2025, 1, 1),
+            "source": f"https://{prefix}.example.com",
+            "category": category,
+        }
+        for n in numbers
+    ]
+
+
+async def _count(prefix):
+    async with async_session() as session:
+        return await session.scalar(
+            select(func.count()).select_from(Article).where(Article.url.like(f"https://{prefix}.example.com/%"))
+        )
+
+
+async def _save_one_by_one(session, articles):
+    """The previous write path: one existence check and one commit per article"""
+    for article in articles:
+        result = await session.execute(select(Article).where(Article.url == article["url"]))
+        if result.scalars().first() is None:
+            await save_article(
+                session,
+                article["title"],
+                article["url"],
+                article["summary"],
+                article["published_at"],
+                article["source"],
+                article["category"],
+            )
+
+
+def test_repeated_urls_are_skipped():
+    async def scenario():
+        async with async_session() as session:
+            first = await save_articles(session, _articles("conflict", range(10)))
+        # Five known URLs, five new ones, and a URL repeated within the batch
+        batch = _articles("conflict", range(5, 15)) + _articles("conflict", [14])
+        batch[0]["title"] = "changed"
+        async with async_session() as session:
+            second = await save_articles(session, batch)
+        async with async_session() as session:
+            title = await session.scalar(
+                select(Article.title).where(Article.url == "https://conflict.example.com/5")
+            )
+        return first, second, title, await _count("conflict")
+
+    first, second, title, count = _run(scenario())
+
+    assert [url for _, url in first] == [f"https://conflict.example.com/{n}" for n in range(10)]
+    # RETURNING only reports the rows that were actually inserted
+    assert sorted(url for _, url in second) == sorted(f"https://conflict.example.com/{n}" for n in range(10, 15))
+    assert len({article_id for article_id, _ in first + second}) == 15
+    assert title == "conflict title 5"  # existing rows are left alone
+    assert count == 15
+
+
+def test_bulk_save_is_faster_than_per_article_saves():
+    async def scenario():
+        async with async_session() as session:
+            started = time.perf_counter()
+            await _save_one_by_one(session, _articles("single", range(BENCHMARK_ARTICLES)))
+            single = time.perf_counter() - started
+        async with async_session() as session:
+            started = time.perf_counter()
+            await save_articles(session, _articles("bulk", range(BENCHMARK_ARTICLES)))
+            bulk = time.perf_counter() - started
+        return single, bulk, await _count("single"), await _count("bulk")
+
+    single, bulk, single_count, bulk_count = _run(scenario())
+    print(
+        f"\n{BENCHMARK_ARTICLES} articles: per-article {single:.2f}s "
+        f"({BENCHMARK_ARTICLES / single:.0f}/s), bulk {bulk:.2f}s ({BENCHMARK_ARTICLES / bulk:.0f}/s), "
+        f"{single / bulk:.1f}x"
+    )
+
+    assert single_count == bulk_count == BENCHMARK_ARTICLES
+    assert bulk * 5 < single